@@ -20,21 +20,33 @@
 import numpy as np  
 import pandas as pd
 import yfinance as yf
+from synthetic_market_data import SyntheticYahooFinance
+from run_export import RunExporter
 from datetime import date
 
+# data source used by load_symbol. Set offline = True to run without yahoo finance on synthetic data
+offline = False
+data_source = SyntheticYahooFinance(seed = 0) if offline else yf
+
 #%% [markdown]
 ## 1. Prepare Helper function
 
-def load_symbol(symbol_list, period = "5y"):
+def load_symbol(symbol_list, period = "5y", actions = False, source = None):
     """ Given a stock symbol and period of interest, load data from yahoo finance and return a panda dataframe """
 
     # valid periods: 1d,5d,1mo,3mo,6mo,1y,2y,5y,10y,ytd,max
 
     # example input: symbol = ["SPY", "APPL"] period = "5y"
     # will download data for SPY and Apple for the past 5 year from today
+    # actions = True also downloads the "Dividends" and "Stock Splits" columns
+
+    # source: any object with a yfinance style download function (e.g. SyntheticYahooFinance), defaulted to data_source
+
+    if (source is None):
+        source = data_source
 
     try: 
-        DF = yf.download(symbol_list, period = period)
+        DF = source.download(symbol_list, period = period, actions = actions)
         return (DF)
     except:
         print ("Failure parsing Yahoo Finance Data")
@@ -53,18 +65,212 @@ def fill_missing_values (DF):
     return (DF)
 
 
-def compute_total_return_by_day (DF):
+def compute_total_return_by_day (DF, total_return = False, expense_ratio = None, adjust_splits = False):
     """
     given a yahoo finance dataframe, compute the investment return from the start date until today
 
     Parameter:
-    DF: A yahoo finance dataframe
-    
+    DF: A yahoo finance dataframe. By default a dataframe of prices (e.g. adjusted close).
+        With total_return = True, the full dataframe from load_symbol(..., actions = True)
+    total_return: if True, build a total return index from the close price with dividends reinvested on the ex-dividend date
+    expense_ratio: optional annual expense ratio, either a float for all funds or a dictionary {ticker: ratio}, e.g. 0.0012 for 0.12%.
+        It is deducted daily (1/252 of a year per trading day)
+    adjust_splits: only needed if the close prices are not split adjusted. Yahoo's "Close" is already split adjusted, so the default ignores the "Stock Splits" column
 
     Return:
     A panda dataframe containing the cumulative return. Each row means return if buying at that particular date
     """
-    return ((DF.iloc[-1]/DF-1.0)[:-1])
+
+    if (total_return == False and expense_ratio is None):
+        return ((DF.iloc[-1]/DF-1.0)[:-1])
+
+    # purchase dates before a fund is listed (its first valid close) have no return
+    if (total_return == True):
+        prices = DF["Close"]
+    else:
+        prices = DF
+    has_return = prices.notna().cummax()
+
+    if (total_return == True):
+        close = fill_missing_values(DF["Close"])
+        dividend = DF["Dividends"].reindex_like(close).fillna(0.0)
+
+        # daily growth of one share with the dividend reinvested at the close
+        growth = (close + dividend) / close.shift(1)
+
+        if (adjust_splits == True):
+            # yahoo reports no split as 0
+            split = DF["Stock Splits"].reindex_like(close).fillna(0.0).replace(0.0, 1.0)
+            growth = growth * split
+    else:
+        growth = DF / DF.shift(1)
+
+    # the first day and missing days have no growth
+    growth = growth.fillna(1.0)
+
+    if (expense_ratio is not None):
+        if (isinstance(expense_ratio, dict)):
+            expense_ratio = pd.Series(expense_ratio).reindex(growth.columns).fillna(0.0).values
+        growth = growth * (1.0 - np.asarray(expense_ratio)) ** (1.0/252)
+
+    # each fund's index starts at its first valid close: no growth and no expense before (or on) that day
+    growth = growth.where(has_return.shift(1, fill_value = False), 1.0)
+
+    # one cumulative product per fund, then the return of buying at each date is index[-1]/index[date]
+    index = pd.DataFrame(np.cumprod(growth.values, axis = 0), index = growth.index, columns = growth.columns)
+
+    return ((index.iloc[-1]/index-1.0).where(has_return)[:-1])
+
+
+def compute_return_surface(DF, horizons = None, filename_prefix = None, block_size = 512, num_bins = 4000, max_log_return = 4.0, quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)):
+    """
+    given a dataframe of prices, compute the return of every purchase date and sell date pair, and summarize the return distribution for each holding period
+
+    The computation works on blocks of purchase dates using the log price in float32, so the memory use is block_size x number of days,
+    no matter how long the history is. The quantiles are estimated from histograms of the log return that are updated block by block.
+
+    Parameter:
+    DF: A dataframe of prices (e.g. adjusted close), missing values before a fund is listed are allowed
+    horizons: A list of holding periods in trading days, defaulted to 1 month, 3 months, 6 months, 1, 3, 5 and 10 years
+    filename_prefix: if given, the full surface for each fund is saved as a memory mapped float32 numpy file named filename_prefix + "_" + ticker + ".npy".
+        Row is the purchase date, column is the sell date, cells with sell date <= purchase date are NaN
+    block_size: number of purchase dates computed at a time
+    num_bins, max_log_return: histogram of the log return, covering -max_log_return to +max_log_return
+    quantiles: A list of quantiles to report
+
+    Return:
+    A panda dataframe indexed by holding period (trading days), with a column for each (ticker, statistic).
+    The statistics are the return quantiles, the probability of loss and the number of observations
+    """
+
+    if (horizons is None):
+        horizons = [21, 63, 126, 252, 756, 1260, 2520]
+
+    T = len(DF.index)
+    horizons = np.array([h for h in horizons if 0 < h < T], dtype = np.int64)
+
+    bin_width = 2.0 * max_log_return / num_bins
+    bin_edges = np.linspace(-max_log_return, max_log_return, num_bins + 1)
+
+    summary = {}
+
+    for ticker in DF.columns:
+
+        log_price = np.log(DF[ticker].values.astype(np.float32))
+
+        if (filename_prefix is not None):
+            surface = np.lib.format.open_memmap(filename_prefix + "_" + ticker + ".npy", mode = "w+", dtype = np.float32, shape = (T, T))
+
+        counts = np.zeros((len(horizons), num_bins), dtype = np.int64)
+
+        for start in range(0, T, block_size):
+            stop = min(start + block_size, T)
+
+            if (filename_prefix is not None):
+                # row i of the block: buy at date start + i, sell at every date
+                block = np.expm1(log_price[None, :] - log_price[start:stop, None])
+                block[np.arange(T)[None, :] <= np.arange(start, stop)[:, None]] = np.nan
+                surface[start:stop] = block
+
+            # the returns of a fixed holding period are a diagonal of the surface
+            for (row, h) in enumerate(horizons):
+                buy = np.arange(start, min(stop, T - h))
+                if (len(buy) == 0):
+                    continue
+
+                log_return = log_price[buy + h] - log_price[buy]
+                log_return = log_return[np.isfinite(log_return)]
+
+                bins = np.clip(((log_return + max_log_return) / bin_width).astype(np.int64), 0, num_bins - 1)
+                counts[row] += np.bincount(bins, minlength = num_bins)
+
+        if (filename_prefix is not None):
+            surface.flush()
+            del surface
+
+        # quantiles by linear interpolation within the histogram bins
+        total = counts.sum(axis = 1)
+        cdf = np.cumsum(counts, axis = 1) / np.maximum(total, 1)[:, None]
+
+        stats = {}
+        for q in quantiles:
+            value = np.full(len(horizons), np.nan)
+            for row in range(len(horizons)):
+                if (total[row] == 0):
+                    continue
+                i = np.searchsorted(cdf[row], q)
+                i = min(i, num_bins - 1)
+                previous = cdf[row, i - 1] if i > 0 else 0.0
+                fraction = (q - previous) / max(cdf[row, i] - previous, 1e-12)
+                value[row] = np.expm1(bin_edges[i] + fraction * bin_width)
+            stats["{:g}%".format(100 * q)] = value
+
+        # 0 is a bin edge, so the bins in the lower half are exactly the losses
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            stats["Probability of Loss"] = counts[:, :num_bins // 2].sum(axis = 1) / total
+        stats["Count"] = total
+
+        summary[ticker] = pd.DataFrame(stats, index = pd.Index(horizons, name = "Holding Period (days)"))
+
+    return (pd.concat(summary, axis = 1))
+
+
+def compute_dca_return_by_day(DF, interval = 21, horizon = None):
+    """
+    given a dataframe of prices, compute the return of dollar cost averaging (DCA) for every start date
+
+    A fixed amount is invested every interval trading days, from the start date until today (or for a fixed horizon).
+    All start dates are computed at once: the units bought at each date are summed with a prefix sum along every
+    interval-th day, so the units held for any start date is a difference of two prefix sums.
+
+    Parameter:
+    DF: A dataframe of prices (e.g. adjusted close), forward filled. A fund that is not listed yet (NaN price) buys nothing
+        and its start dates before listing are NaN
+    interval: number of trading days between two contributions, defaulted to 21 (about one month)
+    horizon: optional holding period in trading days. If None, the investment is valued today
+
+    Return:
+    A tuple of panda dataframes (DCA return, lump sum return). Each row means return if starting at that particular date.
+    The DCA return is the final value over the total amount invested, minus one
+    """
+
+    prices = DF.values.astype(float)
+    (T, n) = prices.shape
+
+    # units bought by investing 1 dollar at each date, none before a fund is listed so the prefix sums stay valid
+    listed = np.isfinite(prices)
+    units = np.where(listed, 1.0 / np.where(listed, prices, 1.0), 0.0)
+
+    # prefix sum over dates with the same position in the contribution cycle (t, t - interval, t - 2*interval, ...)
+    pad = (-T) % interval
+    padded = np.vstack([units, np.zeros((pad, n))])
+    cumulative_units = np.cumsum(padded.reshape(-1, interval, n), axis = 0).reshape(-1, n)[:T]
+
+    start = np.arange(T)
+
+    if (horizon is None):
+        # last contribution on or before today, valued today
+        last = start + interval * ((T - 1 - start) // interval)
+        value_date = np.full(T, T - 1)
+        valid = start < T - 1
+    else:
+        # contributions strictly before the end of the horizon
+        last = start + interval * ((horizon - 1) // interval)
+        value_date = start + horizon
+        valid = value_date <= T - 1
+
+    (start, last, value_date) = (start[valid], last[valid], value_date[valid])
+
+    units_held = cumulative_units[last] - cumulative_units[start] + units[start]
+    amount_invested = ((last - start) // interval + 1)[:, None]
+
+    # no return for the start dates before a fund is listed
+    dca_return = np.where(listed[start], units_held * prices[value_date] / amount_invested - 1.0, np.nan)
+    lump_sum_return = prices[value_date] / prices[start] - 1.0
+
+    index = DF.index[start]
+
+    return (pd.DataFrame(dca_return, index = index, columns = DF.columns), pd.DataFrame(lump_sum_return, index = index, columns = DF.columns))
 
 
 
@@ -235,4 +441,93 @@ except:
 #<br> 
 #It is important to realize that the analysis outlined in this notebook did not considered reinvesting dividends. Since Dividend Appreciation and Real Estate pays much higher dividend then S&P 500, with dividend reinvested, these two stragties actually have higher return then the plot indicates.
 
+#%% [markdown]
+
+## 6. Total return with dividends reinvested
+
+#The total return index is built from the close price, with each dividend reinvested at the close of the ex-dividend date. The return of buying at every date is then computed for all funds at once.
+
+#%%
+
+# load the close price together with the dividend and stock split events
+DF4 = load_symbol(symbol_list2, period = "max", actions = True)
+
+DF5 = compute_total_return_by_day(DF4, total_return = True)
+
+p3 = plot_return (DF5.loc["2016-01-01":today], note_dict = dictionary2)
+show (p3)
+
+try:
+    export_png(p3, filename="Fig 2.4.PNG")
+except:
+    pass
+#work around because Bokeh will not load when uploaded as a Jupyter Notebook on Github
+try:
+    display(Image(filename = "Fig 2.4.PNG"))
+except:
+    pass
+
+#%% [markdown]
+
+## 7. Return by holding period
+
+#Instead of holding until today, the return is computed for every purchase date and sell date pair. The table below summarizes the distribution of the return for holding periods from 1 month to 10 years (in trading days).
+
+#%%
+
+# forward fill only, so that a fund has no return before it is listed
+DF6 = DF4["Adj Close"].fillna(method = "ffill")
+
+# add filename_prefix = "return_surface" to also save the full surface of each fund (about 100MB per fund for the full history)
+DF7 = compute_return_surface(DF6)
+
+display(DF7.xs("Probability of Loss", axis = 1, level = 1))
+display(DF7.xs("50%", axis = 1, level = 1))
+
+#%% [markdown]
+
+## 8. Dollar cost averaging vs lump sum
+
+#Instead of investing everything at the purchase date, dollar cost averaging invests the same amount every month (21 trading days) from the start date until today. The plot shows the return of dollar cost averaging for each start date, and the table shows how often it beats a lump sum purchase.
+
+#%%
+
+# forward filled only (DF6 from section 7), so that a fund has no return before it is listed
+(DF8, DF9) = compute_dca_return_by_day(DF6, interval = 21)
+
+p4 = plot_return (DF8, note_dict = dictionary2)
+show (p4)
+
+try:
+    export_png(p4, filename="Fig 2.5.PNG")
+except:
+    pass
+#work around because Bokeh will not load when uploaded as a Jupyter Notebook on Github
+try:
+    display(Image(filename = "Fig 2.5.PNG"))
+except:
+    pass
+
+# fraction of start dates where dollar cost averaging beats lump sum, over 10 year horizons
+(DF10, DF11) = compute_dca_return_by_day(DF6, interval = 21, horizon = 2520)
+
+# only the start dates after a fund is listed
+display(pd.DataFrame((DF10 > DF11).astype(float).where(DF10.notna()).mean(), columns = ["DCA beats lump sum (10 years)"]))
+
+#%% [markdown]
+
+## 9. Export results
+
+#The cumulative return panels are written as Parquet datasets partitioned by run date and universe (see run_export.py).
+
+#%%
+exporter = RunExporter("results")
+
+exporter.add_total_return("Vanguard", "adjusted-close-value-growth", DF1, parameters = {"symbol_list": symbol_list, "period": "max"})
+exporter.add_total_return("Vanguard", "adjusted-close-all-funds", DF3, parameters = {"symbol_list": symbol_list2, "period": "max"})
+exporter.add_total_return("Vanguard", "total-return", DF5, parameters = {"symbol_list": symbol_list2, "period": "max", "total_return": True})
+exporter.add_total_return("Vanguard", "dca", DF8, parameters = {"symbol_list": symbol_list2, "interval": 21})
+
+exporter.close()
+
 #%%
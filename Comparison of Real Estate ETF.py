@@ -28,7 +28,7 @@
 #The adjusted return data for these three mutual funds are extracted using Yahoo Finance. The cumulative return vs. purchase date were calculated. The earliest purchase date available is November 2017. 
 
 #<br>
-#Note: The calculation of return has not take care of the expense ratio of the ETFs
+#Note: The calculation of return in section 3 has not take care of the expense ratio of the ETFs. Section 3.1 includes dividends reinvested and the expense ratio
 
 
 #%%
@@ -36,22 +36,35 @@
 import numpy as np  
 import pandas as pd
 import yfinance as yf
+from synthetic_market_data import SyntheticYahooFinance, SyntheticQuandl
+from run_export import RunExporter
 from datetime import date, timedelta
 import quandl as ql
+
+# data sources of the prices (load_symbol) and the treasury rate. Set offline = True to run without yahoo finance and quandl on synthetic data
+offline = False
+data_source = SyntheticYahooFinance(seed = 0) if offline else yf
+rate_source = SyntheticQuandl(seed = 0) if offline else ql
 #%% [markdown]
 
 ## 1. Prepare Helper function
 
-def load_symbol(symbol_list, period = "5y"):
+def load_symbol(symbol_list, period = "5y", actions = False, source = None):
     """ Given a stock symbol and period of interest, load data from yahoo finance and return a panda dataframe """
 
     # valid periods: 1d,5d,1mo,3mo,6mo,1y,2y,5y,10y,ytd,max
 
     # example input: symbol = ["SPY", "APPL"] period = "5y"
     # will download data for SPY and Apple for the past 5 year from today
+    # actions = True also downloads the "Dividends" and "Stock Splits" columns
+
+    # source: any object with a yfinance style download function (e.g. SyntheticYahooFinance), defaulted to data_source
+
+    if (source is None):
+        source = data_source
 
     try: 
-        DF = yf.download(symbol_list, period = period)
+        DF = source.download(symbol_list, period = period, actions = actions)
         return (DF)
     except:
         print ("Failure parsing Yahoo Finance Data")
@@ -70,18 +83,61 @@ def fill_missing_values (DF):
     return (DF)
 
 
-def compute_total_return_by_day (DF):
+def compute_total_return_by_day (DF, total_return = False, expense_ratio = None, adjust_splits = False):
     """
     given a yahoo finance dataframe, compute the investment return from the start date until today
 
     Parameter:
-    DF: A yahoo finance dataframe
-    
+    DF: A yahoo finance dataframe. By default a dataframe of prices (e.g. adjusted close).
+        With total_return = True, the full dataframe from load_symbol(..., actions = True)
+    total_return: if True, build a total return index from the close price with dividends reinvested on the ex-dividend date
+    expense_ratio: optional annual expense ratio, either a float for all funds or a dictionary {ticker: ratio}, e.g. 0.0012 for 0.12%.
+        It is deducted daily (1/252 of a year per trading day)
+    adjust_splits: only needed if the close prices are not split adjusted. Yahoo's "Close" is already split adjusted, so the default ignores the "Stock Splits" column
 
     Return:
     A panda dataframe containing the cumulative return. Each row means return if buying at that particular date
     """
-    return ((DF.iloc[-1]/DF-1.0)[:-1])
+
+    if (total_return == False and expense_ratio is None):
+        return ((DF.iloc[-1]/DF-1.0)[:-1])
+
+    # purchase dates before a fund is listed (its first valid close) have no return
+    if (total_return == True):
+        prices = DF["Close"]
+    else:
+        prices = DF
+    has_return = prices.notna().cummax()
+
+    if (total_return == True):
+        close = fill_missing_values(DF["Close"])
+        dividend = DF["Dividends"].reindex_like(close).fillna(0.0)
+
+        # daily growth of one share with the dividend reinvested at the close
+        growth = (close + dividend) / close.shift(1)
+
+        if (adjust_splits == True):
+            # yahoo reports no split as 0
+            split = DF["Stock Splits"].reindex_like(close).fillna(0.0).replace(0.0, 1.0)
+            growth = growth * split
+    else:
+        growth = DF / DF.shift(1)
+
+    # the first day and missing days have no growth
+    growth = growth.fillna(1.0)
+
+    if (expense_ratio is not None):
+        if (isinstance(expense_ratio, dict)):
+            expense_ratio = pd.Series(expense_ratio).reindex(growth.columns).fillna(0.0).values
+        growth = growth * (1.0 - np.asarray(expense_ratio)) ** (1.0/252)
+
+    # each fund's index starts at its first valid close: no growth and no expense before (or on) that day
+    growth = growth.where(has_return.shift(1, fill_value = False), 1.0)
+
+    # one cumulative product per fund, then the return of buying at each date is index[-1]/index[date]
+    index = pd.DataFrame(np.cumprod(growth.values, axis = 0), index = growth.index, columns = growth.columns)
+
+    return ((index.iloc[-1]/index-1.0).where(has_return)[:-1])
 
 
 def plot_return (DF, note_dict = None, legend_position = "top_right"):
@@ -116,6 +172,134 @@ def plot_return (DF, note_dict = None, legend_position = "top_right"):
 
 
 
+def init_live_return(DF):
+    """
+    given a dataframe of prices, prepare the state for live updates of the cumulative return
+
+    The return of buying at date d is last_price / price[d] - 1 = last_price * inverse_price[d] - 1.
+    Keeping the inverse prices means a new quote updates every purchase date with one scale factor,
+    instead of recomputing compute_total_return_by_day.
+
+    Parameter:
+    DF: A dataframe of prices (e.g. adjusted close), without missing values
+
+    Return:
+    A dictionary with the purchase dates, the tickers, the inverse prices (dates x tickers) and the last price of each ticker
+    """
+
+    return ({"dates": DF.index,
+             "tickers": list(DF.columns),
+             "position": dict((ticker, j) for (j, ticker) in enumerate(DF.columns)),
+             "inverse_price": 1.0 / DF.values.astype(float),
+             "last_price": DF.values[-1].astype(float)})
+
+
+def update_live_return(state, quotes):
+    """
+    given new quotes, update the state from init_live_return and compute the new cumulative return (%) of the tickers that changed
+
+    Parameter:
+    state: the dictionary from init_live_return
+    quotes: A dictionary {ticker: latest price}
+
+    Return:
+    A dictionary {ticker: numpy array of cumulative return (%) for every purchase date}, only for the tickers with a new price
+    """
+
+    changed = {}
+
+    for (ticker, price) in quotes.items():
+        j = state["position"].get(ticker)
+        if (j is None or price == state["last_price"][j]):
+            continue
+
+        state["last_price"][j] = price
+        changed[ticker] = (price * state["inverse_price"][:, j] - 1.0) * 100
+
+    return (changed)
+
+
+def simulate_quote_stream(last_price, volatility = 0.0005, seed = 0):
+    """
+    local stand-in for a live quote feed. Each step yields the latest price of a random subset of tickers (random walk)
+
+    Parameter:
+    last_price: A panda series with the starting price of each ticker (e.g. DF.iloc[-1])
+    volatility: standard deviation of the log price change between two quotes
+    seed: random seed
+    """
+
+    rng = np.random.default_rng(seed)
+    tickers = list(last_price.index)
+    price = last_price.values.astype(float).copy()
+
+    while True:
+        ticked = rng.random(len(tickers)) < 0.5
+        price[ticked] = price[ticked] * np.exp(volatility * rng.standard_normal(ticked.sum()))
+        yield (dict((tickers[j], price[j]) for j in np.flatnonzero(ticked)))
+
+
+def make_live_return_app(DF, quote_stream, note_dict = None, legend_position = "top_left", period_ms = 250):
+    """
+    create a Bokeh server application with the cumulative return of plot_return, updated live from a quote stream
+
+    Every period_ms, the next quotes are taken from the stream and only the columns of the tickers that changed are
+    patched in the ColumnDataSource, so the browser receives the new values instead of a new plot.
+
+    Parameter:
+    DF: A dataframe of prices (e.g. adjusted close), without missing values
+    quote_stream: an iterator of dictionaries {ticker: latest price}, e.g. simulate_quote_stream
+    note_dict, legend_position: same as plot_return
+    period_ms: time between two updates in milliseconds
+
+    Return:
+    A function modify_doc(doc) for bokeh.server or show() in a notebook
+    """
+
+    from bokeh.plotting import figure
+    from bokeh.models import ColumnDataSource
+    from bokeh.core.properties import value
+    from bokeh.palettes import Category10_10 as palette
+    from datetime import datetime
+    import itertools
+
+    def modify_doc(doc):
+
+        state = init_live_return(DF)
+
+        data = {"date": state["dates"]}
+        for (j, ticker) in enumerate(state["tickers"]):
+            data[ticker] = (state["last_price"][j] * state["inverse_price"][:, j] - 1.0) * 100
+
+        source = ColumnDataSource(data)
+
+        # create a color cycle for automatic color assignment
+        colors = itertools.cycle(palette)
+
+        p = figure(x_axis_label = "Purchase Date",x_axis_type='datetime', y_axis_label = "Cumulative Return (%)", plot_width=600, plot_height=400, title="Cumulative Return Comparison (live)")
+
+        for ticker in state["tickers"]:
+            if (note_dict == None):
+                label = ticker
+            else: # add additional notation
+                label = str(ticker + " (" + note_dict[ticker] + ")")
+            p.line("date", ticker, source = source, line_width=2, legend = value(label), color = next(colors))
+
+        p.legend.location= legend_position
+
+        def update():
+            changed = update_live_return(state, next(quote_stream))
+
+            if (len(changed) > 0):
+                source.patch(dict((ticker, [(slice(0, len(values)), values)]) for (ticker, values) in changed.items()))
+                p.title.text = "Cumulative Return Comparison (live, " + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ")"
+
+        doc.add_root(p)
+        doc.add_periodic_callback(update, period_ms)
+
+    return (modify_doc)
+
+
 def export_and_display_png(p, filename = "XX.PNG"):
     
     """ Export a bokeh graph to PNG and display the PNG. 
@@ -180,7 +364,7 @@ DF1 = compute_total_return_by_day(DF)
 ### add a line for 10 year treasury ETF
 
 # load data from Quandl
-treasury = ql.get("USTREASURY/YIELD", authtoken = 'XXXX')
+treasury = rate_source.get("USTREASURY/YIELD", authtoken = 'XXXX')
 
 # Subset the 10 yr rate
 treasury_10yr = fill_missing_values(treasury["10 YR"])
@@ -239,6 +423,40 @@ show (p1)
 export_and_display_png(p1, filename = "Fig 3.2.PNG")
 
 
+#%% [markdown]
+
+### 3.1 Total return after dividends and expense ratio
+
+#The total return index reinvests every dividend at the close of the ex-dividend date, and the expense ratio is deducted daily. Only the expense ratios listed in the summary are included, the other ETFs are assumed to have zero expense ratio.
+
+#%%
+expense_ratio = {"VNQ": 0.0012, "PSR": 0.0035, "FREL": 0.00084}
+
+# load the close price together with the dividend and stock split events
+DF2 = load_symbol(symbol_list, period = "max", actions = True)
+
+DF3 = compute_total_return_by_day(DF2, total_return = True, expense_ratio = expense_ratio)
+
+p2 = plot_return (DF3.loc["2016-01-01":today])
+p2.legend.orientation = "horizontal"
+p2.legend.label_text_font_size = "6pt"
+show (p2)
+
+export_and_display_png(p2, filename = "Fig 3.3.PNG")
+
+
+#%% [markdown]
+
+### 3.2 Live update during the trading day
+
+#The plots above use yesterday's close because today's data is not complete. In live mode, the cumulative return is updated with every new quote. A simulated quote stream is used here, any iterator of {ticker: price} can be used instead. The application runs on a Bokeh server (in the notebook, or with bokeh serve).
+
+#%%
+live_app = make_live_return_app(DF, simulate_quote_stream(DF.iloc[-1]))
+
+show(live_app)
+
+
 #%% [markdown]
 
 ## 4. Summary
@@ -253,4 +471,18 @@ export_and_display_png(p1, filename = "Fig 3.2.PNG")
 #As of today, the expense ratio of VNQ, PSR, FREL are 0.12%, 0.35% and 0.084% respectively.
 
 
+#%% [markdown]
+
+## 5. Export results
+
+#The cumulative return panels are written as Parquet datasets partitioned by run date and universe (see run_export.py).
+
+#%%
+exporter = RunExporter("results")
+
+exporter.add_total_return("REIT", "adjusted-close", DF1, parameters = {"symbol_list": symbol_list, "period": "max"})
+exporter.add_total_return("REIT", "total-return", DF3, parameters = {"symbol_list": symbol_list, "period": "max", "total_return": True, "expense_ratio": expense_ratio})
+
+exporter.close()
+
 #%%
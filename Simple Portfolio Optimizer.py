@@ -23,6 +23,15 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import yfinance as yf
+from synthetic_market_data import SyntheticYahooFinance
+from run_export import RunExporter
+from resampled_frontier import compute_max_return, solve_resampled_frontier_batch
+from scipy.cluster.hierarchy import linkage, leaves_list
+from scipy.spatial.distance import squareform
+
+# data source used by load_symbol. Set offline = True to run without yahoo finance on synthetic data
+offline = False
+data_source = SyntheticYahooFinance(seed = 0) if offline else yf
 
 print ("finished loading libraries")
 
@@ -32,7 +41,7 @@ print ("finished loading libraries")
 
 #%% 
 
-def load_symbol(symbol_list, period = "5y"):
+def load_symbol(symbol_list, period = "5y", source = None):
     """ Given a stock symbol and period of interest, load data from yahoo finance and return a panda dataframe """
 
     # valid periods: 1d,5d,1mo,3mo,6mo,1y,2y,5y,10y,ytd,max
@@ -40,12 +49,84 @@ def load_symbol(symbol_list, period = "5y"):
     # example input: symbol = ["SPY", "APPL"] period = "5y"
     # will download data for SPY and Apple for the past 5 year from today
 
+    # source: any object with a yfinance style download function (e.g. SyntheticYahooFinance), defaulted to data_source
+
+    if (source is None):
+        source = data_source
+
     try: 
-        DF = yf.download(symbol_list, period = period)
+        DF = source.download(symbol_list, period = period)
         return (DF)
     except:
         print ("Failure parsing Yahoo Finance Data")
     
+def load_price_panel(symbol_list, period = "5y", fields = ("Adj Close",), dtype = np.float64, chunk_size = 100, source = None):
+    """ Load only the requested fields for a large list of stocks into a single 2-D array
+
+    The stocks are downloaded in chunks. Only the requested fields of each chunk are kept (converted to dtype)
+    and the rest of the download is dropped right away, so the full OHLCV data is never in memory for all stocks.
+
+    Parameters:
+    symbol_list: A list of stock symbols
+    period: same as load_symbol
+    fields: the yahoo finance fields to keep, e.g. ("Adj Close",) or ("Adj Close", "Volume")
+    dtype: np.float64, or np.float32 to halve the memory
+    chunk_size: number of stocks downloaded at a time
+    source: same as load_symbol
+
+    Returns:
+    A panda dataframe backed by one contiguous 2-D array (dates x stocks), with the stock symbols sorted as columns.
+    If more than one field is requested, the columns are a MultiIndex (field, symbol) like load_symbol.
+    The stocks of a chunk that failed to download are left out (and printed), None if every chunk failed
+    """
+
+    fields = list(fields)
+    symbols = sorted(set(symbol_list))
+
+    pieces = []
+    dropped = []
+    for start in range(0, len(symbols), chunk_size):
+        chunk = symbols[start:start + chunk_size]
+
+        DF = load_symbol(chunk, period = period, source = source)
+        if (DF is None):
+            dropped = dropped + chunk
+            continue
+
+        # a single stock is returned without the symbol level
+        if (not isinstance(DF.columns, pd.MultiIndex)):
+            DF.columns = pd.MultiIndex.from_product([DF.columns, chunk])
+
+        pieces.append(DF[fields].astype(dtype))
+        del DF
+
+    if (len(dropped) > 0):
+        print ("failed to load {} of {} symbols: {}".format(len(dropped), len(symbols), ", ".join(dropped)))
+
+    if (len(pieces) == 0):
+        return (None)
+
+    index = pieces[0].index
+    for piece in pieces[1:]:
+        index = index.union(piece.index)
+
+    columns = [symbol for piece in pieces for symbol in piece[fields[0]].columns]
+
+    # fill the single array field by field, chunk by chunk
+    panel = np.full((len(index), len(fields) * len(columns)), np.nan, dtype = dtype)
+
+    position = 0
+    for field in fields:
+        for piece in pieces:
+            block = piece[field].reindex(index).values
+            panel[:, position:position + block.shape[1]] = block
+            position = position + block.shape[1]
+
+    if (len(fields) == 1):
+        return (pd.DataFrame(panel, index = index, columns = columns, copy = False))
+
+    return (pd.DataFrame(panel, index = index, columns = pd.MultiIndex.from_product([fields, columns]), copy = False))
+
 def select_adjclose_column (DF):
     """given a yahoo finance dataframe, select the adjusted close column"""
 
@@ -179,6 +260,460 @@ def compute_sharpe_ratio_portfolio(DF, weight, period = "M", risk_free_rate = 0)
     return (sharpe_ratio)
 
 
+def compute_risk_contribution(weight, cov):
+
+    """calculate the marginal and component risk contribution of every stock for one or many portfolios
+
+    Parameters:
+    weight: A numpy array of portfolio weights, either 1-D (one portfolio) or 2-D (one portfolio per row, e.g. the weights from compute_frontier)
+    cov: the covariance matrix from compute_covariance
+
+    Returns:
+    A tuple of 2-D numpy arrays with one row per portfolio
+    (marginal risk contribution, component risk contribution)
+
+    The component risk contributions of a portfolio add up to its standard deviation (risk)
+    """
+
+    weight = np.atleast_2d(np.asarray(weight, dtype = float))
+    cov = np.asarray(cov, dtype = float)
+
+    # one matrix product for all portfolios: row k is (cov * w_k)
+    cov_weight = weight.dot(cov)
+    risk = np.sqrt(np.einsum("ij,ij->i", cov_weight, weight))
+
+    # a portfolio with zero risk (e.g. all weights zero) has no meaningful contribution
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        marginal = np.where(risk[:, None] > 0, cov_weight / risk[:, None], 0.0)
+
+    component = weight * marginal
+
+    return (marginal, component)
+
+
+def compute_risk_parity(cov, risk_budget = None, tol = 1e-10, max_iter = 100):
+
+    """compute the equal risk contribution (risk parity) portfolio with a dedicated Newton solver
+
+    Solves min 0.5 * y' cov y - sum(b * log(y)) and normalizes y to sum to one, at which point
+    the component risk contribution of every stock is proportional to its budget b.
+    Each iteration is one linear solve, so it scales to thousands of stocks without cvxpy.
+
+    Parameters:
+    cov: the covariance matrix from compute_covariance
+    risk_budget: optional list of float with the target share of risk for each stock, defaulted to equal shares
+    tol: tolerance on the Newton decrement
+    max_iter: maximum number of Newton iterations
+
+    Returns:
+    A numpy array with the weight of each stock, all NaN if the solver did not converge to a positive solution
+    (e.g. a rank deficient covariance with more stocks than dates)
+    """
+
+    cov = np.asarray(cov, dtype = float)
+    n = cov.shape[0]
+
+    if (risk_budget is None):
+        budget = np.full(n, 1.0 / n)
+    else:
+        budget = np.asarray(risk_budget, dtype = float)
+        budget = budget / budget.sum()
+
+    # starting point suggested by Spinu (2013): scaled inverse volatility
+    y = budget / np.sqrt(np.diag(cov))
+    y = y / np.sqrt(y.dot(cov).dot(y))
+
+    for iteration in range(max_iter):
+
+        gradient = cov.dot(y) - budget / y
+        hessian = cov + np.diag(budget / y**2)
+
+        step = np.linalg.solve(hessian, gradient)
+        decrement = np.sqrt(gradient.dot(step))
+
+        # damped step keeps y strictly positive (self-concordance of the log barrier)
+        if (decrement > 0.95):
+            y = y - step / (1.0 + decrement)
+        else:
+            y = y - step
+
+        # a non positive y has a negative risk contribution, the solution is not a risk parity portfolio
+        if (not np.all(np.isfinite(y)) or np.any(y <= 0)):
+            print ("risk parity solver failed: non positive weight after {} iterations".format(iteration + 1))
+            return (np.full(n, np.nan))
+
+        if (decrement < tol):
+            break
+    else:
+        print ("risk parity solver did not converge after {} iterations".format(max_iter))
+        return (np.full(n, np.nan))
+
+    return (y / y.sum())
+
+
+def compute_hrp(DF, linkage_method = "single", risk_free_rate = 0):
+
+    """compute the hierarchical risk parity (HRP) portfolio of Lopez de Prado (2016)
+
+    Stocks are clustered by correlation distance, the covariance is reordered so that similar
+    stocks sit next to each other (quasi-diagonalization), and the weight is split top down
+    between the two halves of every cluster in inverse proportion to their variance
+    (recursive bisection). No optimization problem is solved, so the result is stable even
+    when the covariance matrix is ill-conditioned (e.g. 505 stocks with 60 monthly returns).
+
+    Parameters:
+    DF: A dataframe of stocks with returns
+    linkage_method: the scipy linkage method, defaulted to single linkage (minimum spanning tree, O(n^2))
+    risk_free_rate: annual risk free rate used for the sharpe ratio
+
+    Returns:
+    A tuple of numpy arrays in the same format as compute_frontier (with a single portfolio)
+    (weights, mean_return, standard_deviation, sharpe ratio)
+    """
+
+    cov = compute_covariance(DF).values
+    std = np.sqrt(np.diag(cov))
+    corr = np.clip(cov / np.outer(std, std), -1.0, 1.0)
+
+    # correlation distance, condensed for scipy
+    distance = np.sqrt(0.5 * (1.0 - corr))
+    np.fill_diagonal(distance, 0.0)
+    link = linkage(squareform(distance, checks = False), method = linkage_method)
+
+    # quasi-diagonalization: order stocks by the leaves of the dendrogram
+    order = leaves_list(link)
+
+    # recursive bisection
+    weight = np.ones(len(order))
+    clusters = [order]
+
+    while (len(clusters) > 0):
+
+        next_clusters = []
+
+        for cluster in clusters:
+            if (len(cluster) < 2):
+                continue
+
+            half = len(cluster) // 2
+            left, right = cluster[:half], cluster[half:]
+
+            # variance of each half using inverse-variance weights within the half
+            cluster_var = []
+            for items in (left, right):
+                sub_cov = cov[np.ix_(items, items)]
+                ivp = 1.0 / np.diag(sub_cov)
+                ivp = ivp / ivp.sum()
+                cluster_var.append(ivp.dot(sub_cov).dot(ivp))
+
+            alpha = 1.0 - cluster_var[0] / (cluster_var[0] + cluster_var[1])
+
+            weight[left] *= alpha
+            weight[right] *= 1.0 - alpha
+
+            next_clusters.extend([left, right])
+
+        clusters = next_clusters
+
+    weight_vector = weight.reshape(1, -1)
+    expected_return_vector = np.array([compute_mean_return(DF).values.dot(weight)])
+    risk_vector = np.array([np.sqrt(weight.dot(cov).dot(weight))])
+    sharpe_vector = np.array([compute_sharpe_ratio_portfolio(DF, weight, risk_free_rate = risk_free_rate)])
+
+    return (weight_vector.round(4), expected_return_vector.round(4), risk_vector.round(4), sharpe_vector.round(4))
+
+
+def compute_group_constraints(holdings_DF, symbol_list, group_column = "Sector", groups = None, max_active_weight = None, min_weight = 0.0, max_weight = 1.0):
+    """ Build sector and group exposure constraints as one sparse group membership matrix
+
+    The exposure of every group is (group_matrix * x), so any number of sectors and custom baskets adds only
+    two constraints to the optimization: lower <= group_matrix * x <= upper
+
+    Parameters:
+    holdings_DF: A dataframe of holdings like SPY_All_Holdings.csv (columns "Identifier", "Weight" in percent and the group column)
+    symbol_list: the stocks in the same order as the columns of the return dataframe
+    group_column: the column of holdings_DF with the group of each stock (e.g. "Sector"), or None to only use groups
+    groups: optional dictionary of custom baskets {name: list of symbols}
+    max_active_weight: optional maximum difference between the group weight and the benchmark weight of the group (from "Weight")
+    min_weight, max_weight: bounds on the weight of every group, either a float or a dictionary {group: bound}
+
+    Returns:
+    A tuple (group_matrix as a scipy sparse matrix (groups x stocks), lower bound array, upper bound array, group names)
+    """
+
+    from scipy import sparse
+
+    position = dict((symbol, j) for (j, symbol) in enumerate(symbol_list))
+
+    membership = {}
+    if (group_column is not None):
+        for (symbol, group) in zip(holdings_DF["Identifier"], holdings_DF[group_column]):
+            if (symbol in position):
+                membership.setdefault(group, []).append(position[symbol])
+    if (groups is not None):
+        for (group, members) in groups.items():
+            membership[group] = [position[symbol] for symbol in members if symbol in position]
+
+    names = list(membership)
+    rows = np.concatenate([np.full(len(membership[group]), i) for (i, group) in enumerate(names)])
+    columns = np.concatenate([membership[group] for group in names])
+
+    group_matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape = (len(names), len(symbol_list)))
+
+    def bound(value):
+        if (isinstance(value, dict)):
+            return (np.array([value.get(group, np.nan) for group in names], dtype = float))
+        return (np.full(len(names), value, dtype = float))
+
+    lower = np.nan_to_num(bound(min_weight), nan = 0.0)
+    upper = np.nan_to_num(bound(max_weight), nan = 1.0)
+
+    if (max_active_weight is not None):
+        benchmark = pd.Series(holdings_DF["Weight"].values / 100.0, index = holdings_DF["Identifier"])
+        benchmark = benchmark.groupby(level = 0).sum().reindex(symbol_list).fillna(0.0).values
+        benchmark = group_matrix.dot(benchmark / benchmark.sum())
+
+        lower = np.maximum(lower, benchmark - max_active_weight)
+        upper = np.minimum(upper, benchmark + max_active_weight)
+
+    return (group_matrix, lower, upper, names)
+
+
+def compute_return_memmap(symbol_list, filename, period = "5y", frequency = "M", chunk_size = 200, dtype = np.float32, source = None):
+    """ Compute the returns of a large list of stocks chunk by chunk and store them in a memory mapped numpy file
+
+    Only one chunk of prices is in memory at a time. The dates of the first chunk are used for every chunk,
+    a stock without a price on one of those dates gets a return of zero. Stocks without any price (a chunk that
+    failed to download, or a symbol returned all NaN) are left out of the array and of the stock symbols.
+
+    Parameters:
+    symbol_list: A list of stock symbols
+    filename: the .npy file for the returns (dates x stocks)
+    period: same as load_symbol
+    frequency: "M" for monthly return (compute_monthly_return), "D" for daily return
+    chunk_size: number of stocks loaded at a time
+    dtype: data type of the stored returns
+    source: same as load_symbol
+
+    Returns:
+    A tuple (memory mapped numpy array of returns, the dates, the stock symbols), None if every chunk failed
+    """
+
+    import os
+
+    symbols = sorted(set(symbol_list))
+    returns = None
+
+    # the valid stocks are written next to each other, the number of columns is only known at the end
+    partial_filename = filename + ".partial.npy"
+    valid_symbols = []
+
+    for start in range(0, len(symbols), chunk_size):
+        chunk = symbols[start:start + chunk_size]
+
+        prices = load_price_panel(chunk, period = period, dtype = dtype, chunk_size = chunk_size, source = source)
+
+        # a chunk that failed to download is left out
+        if (prices is None):
+            continue
+
+        chunk = [symbol for symbol in chunk if symbol in prices.columns and prices[symbol].notna().any()]
+        if (len(chunk) == 0):
+            continue
+
+        prices = fill_missing_values(prices[chunk])
+
+        if (frequency == "M"):
+            chunk_return = compute_monthly_return(prices)
+        else:
+            chunk_return = prices.pct_change()[1:]
+
+        if (returns is None):
+            dates = chunk_return.index
+            returns = np.lib.format.open_memmap(partial_filename, mode = "w+", dtype = dtype, shape = (len(dates), len(symbols)))
+
+        position = len(valid_symbols)
+        returns[:, position:position + len(chunk)] = chunk_return.reindex(index = dates, columns = chunk).fillna(0.0).values
+        valid_symbols = valid_symbols + chunk
+
+    if (returns is None):
+        print ("failed to load any symbol")
+        return (None)
+
+    returns.flush()
+
+    if (len(valid_symbols) < len(symbols)):
+        print ("left out {} of {} symbols without any price".format(len(symbols) - len(valid_symbols), len(symbols)))
+
+    # copy the valid columns to the final file, block by block
+    final = np.lib.format.open_memmap(filename, mode = "w+", dtype = dtype, shape = (len(dates), len(valid_symbols)))
+    for start in range(0, len(valid_symbols), chunk_size):
+        end = min(start + chunk_size, len(valid_symbols))
+        final[:, start:end] = returns[:, start:end]
+    final.flush()
+
+    del returns
+    os.remove(partial_filename)
+
+    return (final, dates, valid_symbols)
+
+
+def compute_covariance_blockwise(returns, block_size = 500, filename = None):
+    """ Compute the covariance of a (memory mapped) array of returns, one block of columns at a time
+
+    Only two blocks of returns (dates x block_size) are in memory at a time, so the returns never need to fit in memory.
+
+    Parameters:
+    returns: A numpy array or memory mapped array of returns (dates x stocks), e.g. from compute_return_memmap
+    block_size: number of stocks in a block
+    filename: optional .npy file to store the covariance as a memory mapped array
+
+    Returns:
+    A numpy array (or memory mapped array) with the covariance matrix, same as compute_covariance(DF).values
+    """
+
+    (T, n) = returns.shape
+
+    # column means, block by block
+    mean = np.zeros(n)
+    for start in range(0, n, block_size):
+        mean[start:start + block_size] = returns[:, start:start + block_size].mean(axis = 0, dtype = np.float64)
+
+    if (filename is not None):
+        cov = np.lib.format.open_memmap(filename, mode = "w+", dtype = np.float64, shape = (n, n))
+    else:
+        cov = np.empty((n, n))
+
+    # upper triangle of blocks, mirrored to the lower triangle
+    for i in range(0, n, block_size):
+        block_i = returns[:, i:i + block_size].astype(np.float64) - mean[i:i + block_size]
+
+        for j in range(i, n, block_size):
+            block_j = returns[:, j:j + block_size].astype(np.float64) - mean[j:j + block_size]
+
+            block_cov = block_i.T.dot(block_j) / (T - 1)
+            cov[i:i + block_size, j:j + block_size] = block_cov
+            cov[j:j + block_size, i:i + block_size] = block_cov.T
+
+    if (filename is not None):
+        cov.flush()
+
+    return (cov)
+
+
+def compute_portfolio_return_blockwise(returns, weight, block_size = 500):
+    """ Compute the return by date of one or many portfolios from a (memory mapped) array of returns, one block of columns at a time
+
+    Parameters:
+    returns: A numpy array or memory mapped array of returns (dates x stocks), e.g. from compute_return_memmap
+    weight: A numpy array of portfolio weights, either 1-D (one portfolio) or 2-D (one portfolio per row)
+    block_size: number of stocks in a block
+
+    Returns:
+    A numpy array (dates x portfolios), same as returns.dot(weight.T)
+    """
+
+    weight = np.atleast_2d(np.asarray(weight, dtype = float))
+
+    (T, n) = returns.shape
+    portfolio_return = np.zeros((T, len(weight)))
+
+    for start in range(0, n, block_size):
+        portfolio_return += returns[:, start:start + block_size].astype(np.float64).dot(weight[:, start:start + block_size].T)
+
+    return (portfolio_return)
+
+
+def compute_frontier_out_of_core(returns, max_indi_allocation = 0.3, num_points = 50, period = "M", risk_free_rate = 0, block_size = 500, solver = None):
+
+    """Compute the efficient frontier of a (memory mapped) array of returns without the covariance matrix
+
+    The variance is written as ||factor * x||^2 with factor = centered returns / sqrt(T-1), built block by block,
+    so the solver holds a dates x stocks factor instead of the stocks x stocks covariance (e.g. 1260 x 3000 daily
+    returns instead of 3000 x 3000). The problem is compiled once with the required return as a parameter.
+
+    Paramters:
+    returns: A numpy array or memory mapped array of returns (dates x stocks), e.g. from compute_return_memmap
+    max_indi_allocation: maximum portfolio allocation for each stock
+    num_points: number of points, evenly spaced from the minimum variance portfolio to the maximum return
+    period: "M", "W" or "D", the period of the returns (see compute_sharpe_ratio_portfolio)
+    risk_free_rate: annual risk free rate used for the sharpe ratio
+    block_size: number of stocks read from returns at a time
+    solver: optional cvxpy solver, defaulted to the cvxpy default (OSQP is faster on small problems but often stalls near the maximum return)
+
+    Returns:
+    A tuple of numpy arrays
+    (weights, mean_return, standard_deviation, sharpe ratio)
+
+    """
+
+    (T, n) = returns.shape
+
+    mean_return = np.zeros(n)
+    factor = np.empty((T, n))
+
+    for start in range(0, n, block_size):
+        block = returns[:, start:start + block_size].astype(np.float64)
+        mean_return[start:start + block_size] = block.mean(axis = 0)
+        factor[:, start:start + block_size] = (block - block.mean(axis = 0)) / np.sqrt(T - 1)
+
+    x = cp.Variable(n)
+    req_return = cp.Parameter()
+
+    risk = cp.sum_squares(factor @ x)
+
+    constraints = [cp.sum(x) == 1, mean_return @ x >= req_return, x >= 0, x <= max_indi_allocation]
+
+    prob = cp.Problem(cp.Minimize(risk), constraints)
+
+    # initialize numpy array for storing results
+    weight_vector = np.zeros((0, n))
+    risk_vector = np.zeros((0))
+
+    # minimum variance portfolio (the return constraint is not binding)
+    req_return.value = mean_return.min() - 1.0
+    try:
+        prob.solve(solver = solver)
+    except:
+        pass
+
+    if (prob.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)):
+        print ("could not solve the minimum variance portfolio")
+        return (weight_vector, np.zeros((0)), risk_vector, np.zeros((0)))
+
+    min_return = mean_return.dot(x.value)
+
+    # the maximum return is on the edge of the feasible set, pull it back slightly (see compute_frontier_adaptive)
+    max_return = compute_max_return(mean_return, max_indi_allocation)
+    max_return = max_return - 1e-4 * (max_return - min_return)
+
+    for value in np.linspace(min_return, max_return, num_points):
+
+        req_return.value = value
+
+        try:
+            prob.solve(solver = solver, warm_start = True)
+        except:
+            # if there is no solution, do nothing
+            continue
+
+        if (prob.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)):
+            continue
+
+        weight_vector = np.append(weight_vector, x.value.reshape(1, n), axis = 0)
+        risk_vector = np.append(risk_vector, max(risk.value, 0.0)**0.5)
+
+    print ("finished out of core frontier with {} points".format(len(weight_vector)))
+
+    expected_return_vector = weight_vector.dot(mean_return)
+
+    # return by date of every portfolio, read block by block from returns
+    portfolio_return = compute_portfolio_return_blockwise(returns, weight_vector, block_size = block_size)
+    sharpe_vector = np.array([compute_sharpe_ratio_portfolio(pd.DataFrame(portfolio_return[:, [k]]), [1.0], period = period, risk_free_rate = risk_free_rate) for k in range(len(weight_vector))])
+
+    return (weight_vector.round(4), expected_return_vector.round(4), risk_vector.round(4), sharpe_vector.round(4))
+
+
 
 
 
@@ -266,7 +801,7 @@ try:
     print ("Optimal portfolio")
     print ("----------------------")
 
-    portfolio_DF = pd.DataFrame({"Ticker":symbol_list, "Percentage": np.round(x.value,4)*np.array(100.0)})
+    portfolio_DF = pd.DataFrame({"Ticker":DF1.columns, "Percentage": np.round(x.value,4)*np.array(100.0)})
 
     display(portfolio_DF)
 
@@ -286,7 +821,7 @@ except:
 
 #### 2.3 Wrap the optimization routine in function and obtain efficient frontier
 
-def compute_frontier(DF, max_indi_allocation = 0.3, num_points = 50, risk_free_rate = 0):
+def compute_frontier(DF, max_indi_allocation = 0.3, num_points = 50, risk_free_rate = 0, cov = None, adaptive = False, tol = 1e-4, group_constraints = None):
 
     """Compute the weights, return, and risk for plot the efficent frontier 
     
@@ -295,6 +830,10 @@ def compute_frontier(DF, max_indi_allocation = 0.3, num_points = 50, risk_free_r
     min_ticker_count
     max_indi_allocation: maximum portfolio allocation for each stock
     num_points: An integer indicating the number of points for simulation
+    cov: the covariance matrix, defaulted to compute_covariance(DF). For very large universes, use compute_frontier_out_of_core instead
+    adaptive: if True, use compute_frontier_adaptive, num_points is then the maximum number of points
+    tol: tolerance on the standard deviation for the adaptive mode
+    group_constraints: optional sector/group exposure constraints from compute_group_constraints
 
 
     Returns:
@@ -303,6 +842,9 @@ def compute_frontier(DF, max_indi_allocation = 0.3, num_points = 50, risk_free_r
 
     """
 
+    if (adaptive == True):
+        return (compute_frontier_adaptive(DF, max_indi_allocation = max_indi_allocation, max_points = num_points, risk_free_rate = risk_free_rate, cov = cov, tol = tol, group_constraints = group_constraints))
+
     n = len(DF.columns)
     
     x = cp.Variable(n)
@@ -315,11 +857,14 @@ def compute_frontier(DF, max_indi_allocation = 0.3, num_points = 50, risk_free_r
 
 
     # initialize numpy array for storing results
-    weight_vector = np.zeros((1, n))
+    weight_vector = np.zeros((0, n))
     risk_vector = np.zeros((0))
     expected_return_vector = np.zeros((0))
     sharpe_vector = np.zeros((0))
 
+    if (cov is None):
+        cov = compute_covariance(DF)
+
     for (index, req_return) in enumerate(return_vector):
 
         print (index,req_return)
@@ -327,12 +872,17 @@ def compute_frontier(DF, max_indi_allocation = 0.3, num_points = 50, risk_free_r
 
 
         expected_return = mean_return.T*x
-        risk = cp.quad_form(x, compute_covariance(DF))
+        risk = cp.quad_form(x, np.asarray(cov))
 
         objective = cp.Minimize(risk)
 
         constraints = [cp.sum(x) == 1, expected_return >= req_return, x >= 0, x <= max_indi_allocation]
 
+        # all groups in one sparse matrix, so only two constraints no matter how many groups
+        if (group_constraints is not None):
+            (group_matrix, group_lower, group_upper) = group_constraints[:3]
+            constraints = constraints + [group_matrix @ x >= group_lower, group_matrix @ x <= group_upper]
+
         prob = cp.Problem(objective, constraints)
 
         try:
@@ -366,6 +916,203 @@ def compute_frontier(DF, max_indi_allocation = 0.3, num_points = 50, risk_free_r
     return (weight_vector.round(4), expected_return_vector.round(4), risk_vector.round(4), sharpe_vector.round(4))
 
 
+def compute_frontier_adaptive(DF, max_indi_allocation = 0.3, max_points = 50, risk_free_rate = 0, cov = None, tol = 1e-4, group_constraints = None):
+
+    """Compute the efficient frontier with the points placed where the frontier bends
+
+    The frontier only exists between the minimum variance portfolio and the maximum return allowed by
+    max_indi_allocation, so these two portfolios are solved first. Then the interval with the largest error
+    is split at its middle, where the error is the gap between the solved standard deviation and the straight
+    line between the two ends of the interval. This stops when every interval is within tol or max_points are solved.
+    The problem is compiled once with the required return as a parameter and each solve is warm started.
+
+    Paramters:
+    DF: A dataframe of stocks with returns
+    max_indi_allocation: maximum portfolio allocation for each stock
+    max_points: maximum number of points (solves)
+    risk_free_rate: annual risk free rate used for the sharpe ratio
+    cov: the covariance matrix, defaulted to compute_covariance(DF)
+    tol: tolerance on the standard deviation
+    group_constraints: optional sector/group exposure constraints from compute_group_constraints
+
+    Returns:
+    A tuple of numpy arrays, sorted by return
+    (weights, mean_return, standard_deviation, sharpe ratio)
+
+    """
+
+    import heapq
+
+    n = len(DF.columns)
+
+    mean_return = compute_mean_return(DF).values
+
+    if (cov is None):
+        cov = compute_covariance(DF)
+
+    x = cp.Variable(n)
+    req_return = cp.Parameter()
+
+    expected_return = mean_return @ x
+    risk = cp.quad_form(x, np.asarray(cov))
+
+    constraints = [cp.sum(x) == 1, expected_return >= req_return, x >= 0, x <= max_indi_allocation]
+
+    if (group_constraints is None):
+        max_return = compute_max_return(mean_return, max_indi_allocation)
+    else:
+        (group_matrix, group_lower, group_upper) = group_constraints[:3]
+        constraints = constraints + [group_matrix @ x >= group_lower, group_matrix @ x <= group_upper]
+
+        # the group constraints can lower the maximum return, find it with a linear program
+        max_prob = cp.Problem(cp.Maximize(expected_return), constraints[:1] + constraints[2:])
+        max_prob.solve()
+        max_return = max_prob.value if max_prob.status == cp.OPTIMAL else np.nan
+
+    if (np.isnan(max_return)):
+        print ("the constraints are too tight for {} stocks, no portfolio is feasible".format(n))
+        return (np.zeros((0, n)), np.zeros((0)), np.zeros((0)), np.zeros((0)))
+
+    prob = cp.Problem(cp.Minimize(risk), constraints)
+
+    # required return -> (weight, standard deviation)
+    points = {}
+
+    def solve(value):
+        """ solve for a required return, returns the standard deviation or None if the solve failed """
+        req_return.value = value
+        try:
+            prob.solve(warm_start = True)
+        except:
+            return (None)
+        if (prob.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)):
+            return (None)
+        points[value] = (x.value.copy(), max(risk.value, 0.0)**0.5)
+        return (points[value][1])
+
+    # the minimum variance portfolio (the return constraint is not binding)
+    if (solve(mean_return.min() - 1.0) is None):
+        print ("could not solve the minimum variance portfolio")
+        return (np.zeros((0, n)), np.zeros((0)), np.zeros((0)), np.zeros((0)))
+
+    (weight_min, std_min) = points.pop(mean_return.min() - 1.0)
+    min_return = float(mean_return.dot(weight_min))
+    points[min_return] = (weight_min, std_min)
+
+    # the maximum return is on the edge of the feasible set where the solver can report infeasible,
+    # so pull it back slightly, and further if the solve still fails
+    upper_return = None
+    for attempt in range(5):
+        candidate = max_return - 1e-4 * 10**attempt * (max_return - min_return)
+        if (candidate <= min_return):
+            break
+        if (solve(candidate) is not None):
+            upper_return = candidate
+            break
+
+    # intervals ordered by the error of their parent, largest first
+    if (upper_return is None):
+        intervals = []
+    else:
+        intervals = [(-np.inf, min_return, upper_return)]
+
+    while (len(intervals) > 0 and len(points) < max_points):
+
+        (priority, low, high) = heapq.heappop(intervals)
+
+        middle = 0.5 * (low + high)
+        std_middle = solve(middle)
+
+        # drop an interval whose middle can not be solved
+        if (std_middle is None):
+            continue
+
+        error = abs(0.5 * (points[low][1] + points[high][1]) - std_middle)
+
+        if (error > tol):
+            heapq.heappush(intervals, (-error, low, middle))
+            heapq.heappush(intervals, (-error, middle, high))
+
+    print ("finished adaptive frontier with {} points".format(len(points)))
+
+    return_list = sorted(points)
+
+    weight_vector = np.array([points[r][0] for r in return_list])
+    expected_return_vector = weight_vector.dot(mean_return)
+    risk_vector = np.array([points[r][1] for r in return_list])
+    sharpe_vector = np.array([compute_sharpe_ratio_portfolio(DF, w, risk_free_rate = risk_free_rate) for w in weight_vector])
+
+    return (weight_vector.round(4), expected_return_vector.round(4), risk_vector.round(4), sharpe_vector.round(4))
+
+
+def compute_resampled_frontier(DF, num_samples = 200, num_points = 50, max_indi_allocation = 0.3, method = "bootstrap", risk_free_rate = 0, batch_size = 10, max_workers = None, seed = 0):
+
+    """Compute the resampled (robust) efficient frontier of Michaud
+
+    The monthly returns are resampled num_samples times, the frontier of each resample is solved at num_points
+    evenly spaced returns (from its minimum variance portfolio to its maximum return), and the weights at each
+    rank are averaged. The resamples are solved in batches across a process pool (the worker
+    solve_resampled_frontier_batch is in resampled_frontier.py so that the processes can import it).
+
+    Paramters:
+    DF: A dataframe of stocks with returns
+    num_samples: number of resamples
+    num_points: number of points on each frontier
+    max_indi_allocation: maximum portfolio allocation for each stock
+    method: "bootstrap" to draw the months with replacement, "parametric" to draw from a normal distribution with the sample mean and covariance
+    risk_free_rate: annual risk free rate used for the sharpe ratio
+    batch_size: number of resamples solved by a worker at a time
+    max_workers: number of processes, defaulted to the number of cpu. Use 1 to solve in this process
+    seed: random seed
+
+    Returns:
+    A tuple of numpy arrays, evaluated with the mean return and covariance of DF
+    (weights, mean_return, standard_deviation, sharpe ratio)
+
+    """
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    returns = DF.values.astype(float)
+    (T, n) = returns.shape
+
+    rng = np.random.default_rng(seed)
+
+    # generate the resamples for all batches at once
+    batches = []
+    if (method == "bootstrap"):
+        index = rng.integers(0, T, size = (num_samples, T))
+        for start in range(0, num_samples, batch_size):
+            batch_index = index[start:start + batch_size]
+            batches.append((returns, batch_index, None, None, None, len(batch_index), num_points, max_indi_allocation))
+    else:
+        mean = returns.mean(axis = 0)
+        # small ridge, the sample covariance is singular when there are more stocks than months
+        chol = np.linalg.cholesky(np.cov(returns.T) + 1e-10 * np.eye(n))
+        seeds = rng.integers(0, 2**32, size = num_samples)
+        for start in range(0, num_samples, batch_size):
+            batches.append((returns, None, mean, chol, seeds[start], min(batch_size, num_samples - start), num_points, max_indi_allocation))
+
+    if (max_workers == 1):
+        results = [solve_resampled_frontier_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            results = list(executor.map(solve_resampled_frontier_batch, batches))
+
+    # average the weights at each rank over the resamples
+    weight_vector = np.nanmean(np.concatenate(results, axis = 0), axis = 0)
+
+    cov = compute_covariance(DF).values
+
+    expected_return_vector = weight_vector.dot(compute_mean_return(DF).values)
+    risk_vector = np.sqrt(np.einsum("ij,jk,ik->i", weight_vector, cov, weight_vector))
+    sharpe_vector = np.array([compute_sharpe_ratio_portfolio(DF, w, risk_free_rate = risk_free_rate) for w in weight_vector])
+
+    print ("finished {} resamples".format(num_samples))
+
+    return (weight_vector.round(4), expected_return_vector.round(4), risk_vector.round(4), sharpe_vector.round(4))
+
+
 # run the above function
 (weight,ret, std,sharpe) = compute_frontier(DF1)
 
@@ -438,11 +1185,157 @@ except:
 # The dataframe belows shows the optimized portfolio after considering Sharpe Ratio. 
 
 #%%
-portfolio_DF = pd.DataFrame({"Ticker":symbol_list, "Percentage": 100.0*weight[np.argmax(sharpe)]})
+portfolio_DF = pd.DataFrame({"Ticker":DF1.columns, "Percentage": 100.0*weight[np.argmax(sharpe)]})
 
 display(portfolio_DF[portfolio_DF["Percentage"] > 0.0001])
 
 
+#%% [markdown]
+### 2.6 Risk contribution of each stock
+
+# The standard deviation of a portfolio can be split into the contribution from each stock (weight x marginal risk). The component contributions of a portfolio add up to its risk. All frontier portfolios are computed in one pass.
+
+#%%
+(marginal_risk, component_risk) = compute_risk_contribution(weight, compute_covariance(DF1))
+
+risk_contribution_DF = pd.DataFrame({"Ticker":DF1.columns, "Percentage": 100.0*weight[np.argmax(sharpe)], "Risk Contribution (%)": 100.0*component_risk[np.argmax(sharpe)]/std[np.argmax(sharpe)]})
+
+display(risk_contribution_DF[risk_contribution_DF["Percentage"] > 0.0001])
+
+
+#%% [markdown]
+### 2.7 Risk parity portfolio
+
+# Instead of targeting a return, the risk parity (equal risk contribution) portfolio allocates so that every stock contributes the same amount of risk.
+
+#%%
+weight_rp = compute_risk_parity(compute_covariance(DF1))
+
+(marginal_risk_rp, component_risk_rp) = compute_risk_contribution(weight_rp, compute_covariance(DF1))
+
+portfolio_DF_rp = pd.DataFrame({"Ticker":DF1.columns, "Percentage": np.round(weight_rp,4)*np.array(100.0), "Risk Contribution (%)": 100.0*component_risk_rp[0]/component_risk_rp[0].sum()})
+
+display(portfolio_DF_rp)
+
+print ('Exp return = {:.4f}%'.format(compute_mean_return(DF1).values.dot(weight_rp)*100))
+print ('risk    = {:.4f}'.format(component_risk_rp[0].sum()))
+
+
+#%% [markdown]
+### 2.8 Minimizing Conditional Value-at-Risk (CVaR)
+
+# The standard deviation treats gains and losses the same way. CVaR at 95% is the average loss in the worst 5% of the historical periods (scenarios). Following Rockafellar and Uryasev (2000), minimizing CVaR under the same constraints is a linear program:
+
+# minimize alpha + sum(u) / ((1 - beta) * S), subject to u >= -R * x - alpha, u >= 0
+
+# where R is the return of the S scenarios. The LP is compiled once with the required return as a parameter and reused for every point of the frontier.
+
+#%%
+def compute_cvar_frontier(DF, beta = 0.95, max_indi_allocation = 0.3, num_points = 50, num_scenarios = None, period = "M", risk_free_rate = 0, seed = 0, solver = None):
+
+    """Compute the weights, return, and CVaR for the mean-CVaR efficient frontier
+
+    Paramters:
+    DF: A dataframe of stocks with returns, each row is a scenario (e.g. monthly or daily return)
+    beta: confidence level of the CVaR
+    max_indi_allocation: maximum portfolio allocation for each stock
+    num_points: number of points, evenly spaced from the minimum CVaR portfolio to the maximum return
+    num_scenarios: optional number of scenarios randomly selected from the rows of DF, to reduce the size of the LP
+    period: period of the returns for the sharpe ratio ("M", "W" or "D")
+    risk_free_rate: annual risk free rate used for the sharpe ratio
+    seed: random seed for selecting the scenarios
+    solver: the cvxpy solver, defaulted to HiGHS (a dedicated LP solver) if it is installed
+
+    Returns:
+    A tuple of numpy arrays
+    (weights, mean_return, CVaR, sharpe ratio)
+
+    """
+
+    scenarios = DF.values.astype(float)
+
+    if (num_scenarios is not None and num_scenarios < len(scenarios)):
+        rng = np.random.default_rng(seed)
+        scenarios = scenarios[np.sort(rng.choice(len(scenarios), num_scenarios, replace = False))]
+
+    (S, n) = scenarios.shape
+
+    if (solver is None and cp.HIGHS in cp.installed_solvers()):
+        solver = cp.HIGHS
+
+    mean_return = compute_mean_return(DF).values
+
+    x = cp.Variable(n)
+    alpha = cp.Variable()
+    u = cp.Variable(S, nonneg = True)
+    req_return = cp.Parameter()
+
+    cvar = alpha + cp.sum(u) / ((1.0 - beta) * S)
+
+    constraints = [u >= -scenarios @ x - alpha, cp.sum(x) == 1, mean_return @ x >= req_return, x >= 0, x <= max_indi_allocation]
+
+    prob = cp.Problem(cp.Minimize(cvar), constraints)
+
+    # initialize numpy array for storing results
+    weight_vector = np.zeros((0, n))
+    cvar_vector = np.zeros((0))
+    expected_return_vector = np.zeros((0))
+    sharpe_vector = np.zeros((0))
+
+    # minimum CVaR portfolio (the return constraint is not binding)
+    req_return.value = mean_return.min() - 1.0
+    try:
+        prob.solve(solver = solver)
+    except:
+        pass
+
+    if (prob.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)):
+        print ("could not solve the minimum CVaR portfolio")
+        return (weight_vector, expected_return_vector, cvar_vector, sharpe_vector)
+
+    min_return = mean_return.dot(x.value)
+
+    # the maximum return is on the edge of the feasible set, pull it back slightly (see compute_frontier_adaptive)
+    max_return = compute_max_return(mean_return, max_indi_allocation)
+    max_return = max_return - 1e-4 * (max_return - min_return)
+
+    for value in np.linspace(min_return, max_return, num_points):
+
+        req_return.value = value
+
+        try:
+            prob.solve(solver = solver, warm_start = True)
+        except:
+            # if there is no solution, skip the point
+            continue
+
+        if (prob.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)):
+            continue
+
+        weight_vector = np.append(weight_vector, x.value.reshape(1,n), axis = 0)
+
+        cvar_vector = np.append(cvar_vector, cvar.value)
+
+        expected_return_vector = np.append(expected_return_vector, mean_return.dot(x.value))
+
+        sharpe_vector = np.append(sharpe_vector, compute_sharpe_ratio_portfolio(DF, x.value, period = period, risk_free_rate = risk_free_rate))
+
+    print ("finished looping")
+
+    return (weight_vector.round(4), expected_return_vector.round(4), cvar_vector.round(4), sharpe_vector.round(4))
+
+
+# daily returns of the Dow Jones 30 stocks as scenarios, 1000 of them randomly selected
+(weight_cvar, ret_cvar, cvar_cvar, sharpe_cvar) = compute_cvar_frontier(DF.pct_change()[1:], num_scenarios = 1000, period = "D")
+
+portfolio_DF_cvar = pd.DataFrame({"Ticker":DF.columns, "Percentage": 100.0*weight_cvar[np.argmax(sharpe_cvar)]})
+
+display(portfolio_DF_cvar[portfolio_DF_cvar["Percentage"] > 0.0001])
+
+print ('Exp daily return = {:.4f}%'.format(ret_cvar[np.argmax(sharpe_cvar)]*100))
+print ('CVaR (95%)    = {:.4f}'.format(cvar_cvar[np.argmax(sharpe_cvar)]))
+
+
 #%% [markdown]
 
 ## 3. Using the same procedure to select best portfolio from S&P 500 (a larger pool)
@@ -455,11 +1348,11 @@ A = pd.read_csv("SPY_ALL_Holdings.csv")
 
 symbol_list1 = list(A["Identifier"])
 
-# Load Yahoo Data
-DF3 =  load_symbol(symbol_list1, period = "5y")
+# Load Yahoo Data, keeping only the adjusted close of each stock
+DF3 =  load_price_panel(symbol_list1, period = "5y", fields = ["Adj Close"])
 
-# select adjusted close and fill missing values (especially for the DOW Company)
-DF3 = fill_missing_values(select_adjclose_column(DF3))
+# fill missing values (especially for the DOW Company)
+DF3 = fill_missing_values(DF3)
 
 # calculate monthly return and assign it to DF1
 DF4 = compute_monthly_return(DF3)
@@ -475,7 +1368,8 @@ DF4.head(10)
 
 
 #%% 
-(weight1,ret1,std1,sharpe1) = compute_frontier(DF4, risk_free_rate = 0.02)
+# with 505 stocks each solve is slow, so place the points adaptively along the frontier
+(weight1,ret1,std1,sharpe1) = compute_frontier(DF4, risk_free_rate = 0.02, adaptive = True)
 
 
 p1 = figure(x_axis_label = "Standard Deviation", y_axis_label = "monthly return", plot_width=600, plot_height=400, title="Efficient Fronter")
@@ -516,9 +1410,293 @@ except:
 
 
 #%%
-portfolio_DF1 = pd.DataFrame({"Ticker":symbol_list1, "Percentage": 100.0*weight1[np.argmax(sharpe1)]})
+portfolio_DF1 = pd.DataFrame({"Ticker":DF4.columns, "Percentage": 100.0*weight1[np.argmax(sharpe1)]})
 
 display(portfolio_DF1[portfolio_DF1["Percentage"] > 0.0001])
 
 
+#%% [markdown]
+
+### 3.1 Hierarchical risk parity
+
+# With 505 stocks and only 60 monthly returns the covariance matrix is ill-conditioned, so the optimized weights are unstable. Hierarchical risk parity clusters the stocks by correlation and allocates top down without solving an optimization problem.
+
+#%%
+(weight_hrp, ret_hrp, std_hrp, sharpe_hrp) = compute_hrp(DF4, risk_free_rate = 0.02)
+
+print ('Exp return = {:.4f}%'.format(ret_hrp[0]*100))
+print ('risk    = {:.4f}'.format(std_hrp[0]))
+print ('sharpe ratio = {:.4f}'.format(sharpe_hrp[0]))
+
+portfolio_DF_hrp = pd.DataFrame({"Ticker":DF4.columns, "Percentage": 100.0*weight_hrp[0]})
+
+display(portfolio_DF_hrp.sort_values("Percentage", ascending = False).head(20))
+
+
+#%% [markdown]
+
+### 3.2 Large universe (out of core)
+
+# For universes much larger than the S&P 500 (e.g. Russell 3000) with long daily history, the returns are stored in a memory mapped file and read block by block. The frontier is solved with the returns themselves as the risk factor, so the covariance matrix is never formed. Here the 5 years of daily returns of the SPY holdings are used.
+
+#%%
+(returns_large, dates_large, symbol_list_large) = compute_return_memmap(symbol_list1, "returns_large.npy", period = "5y", frequency = "D")
+
+(weight_large, ret_large, std_large, sharpe_large) = compute_frontier_out_of_core(returns_large, num_points = 20, period = "D", risk_free_rate = 0.02)
+
+# the covariance is only needed for the risk contribution of the best portfolio, it is computed block by block into a memory mapped file
+cov_large = compute_covariance_blockwise(returns_large, filename = "covariance_large.npy")
+
+(marginal_risk_large, component_risk_large) = compute_risk_contribution(weight_large[np.argmax(sharpe_large)], cov_large)
+
+portfolio_DF_large = pd.DataFrame({"Ticker":symbol_list_large, "Percentage": 100.0*weight_large[np.argmax(sharpe_large)], "Risk Contribution (%)": 100.0*component_risk_large[0]/component_risk_large[0].sum()})
+
+display(portfolio_DF_large[portfolio_DF_large["Percentage"] > 0.0001])
+
+
+#%% [markdown]
+
+### 3.3 Resampled efficient frontier
+
+# The optimized weights are very sensitive to the estimated mean and covariance. The resampled frontier solves the frontier for 200 bootstrap resamples of the monthly returns and averages the weights, which gives a more diversified and stable portfolio.
+
+#%%
+(weight_rs, ret_rs, std_rs, sharpe_rs) = compute_resampled_frontier(DF4, num_samples = 200, risk_free_rate = 0.02)
+
+portfolio_DF_rs = pd.DataFrame({"Ticker":DF4.columns, "Percentage": 100.0*weight_rs[np.argmax(sharpe_rs)]})
+
+display(portfolio_DF_rs[portfolio_DF_rs["Percentage"] > 0.0001])
+
+
+#%% [markdown]
+
+### 3.4 Sector constraints
+
+# The optimized portfolio above can be concentrated in a few sectors. Using the Sector and Weight columns of the SPY holdings, the weight of each sector is kept within 5% of its weight in the S&P 500.
+
+#%%
+sector_constraints = compute_group_constraints(A, list(DF4.columns), group_column = "Sector", max_active_weight = 0.05)
+
+(weight_sector, ret_sector, std_sector, sharpe_sector) = compute_frontier(DF4, risk_free_rate = 0.02, adaptive = True, group_constraints = sector_constraints)
+
+sector_DF = pd.DataFrame({"Sector": sector_constraints[3], "Portfolio (%)": 100.0*sector_constraints[0].dot(weight_sector[np.argmax(sharpe_sector)]), "Lower (%)": 100.0*sector_constraints[1], "Upper (%)": 100.0*sector_constraints[2]})
+
+display(sector_DF)
+
+
+#%% [markdown]
+
+## 4. Interactive frontier explorer
+
+# Changing the required return, the maximum allocation or the risk free rate normally means rerunning the cells above. The explorer below runs on a Bokeh server: the optimization problem is compiled once with these values as parameters, every slider move re-solves it warm started, and only the data that changed is sent to the plot. The frontier for a new maximum allocation is re-solved one point at a time in the background.
+
+#%%
+from bokeh.models import ColumnDataSource, Slider, Div
+from bokeh.layouts import column, row
+import time
+
+
+def make_frontier_explorer_app(DF, req_return = 0.015, max_indi_allocation = 0.3, risk_free_rate = 0, num_points = 20):
+
+    """Create a Bokeh server application to explore the efficient frontier with sliders
+
+    The risk is written as ||F x||^2 with F the centered returns / sqrt(T-1) (the same as x' cov x, but much
+    smaller than the covariance when there are more stocks than months), and the required return and maximum
+    allocation are cvxpy Parameters, so the problem is compiled once and every solve is warm started.
+    The risk free rate only changes the sharpe ratio, so it does not need a solve.
+
+    Paramters:
+    DF: A dataframe of stocks with returns
+    req_return, max_indi_allocation, risk_free_rate: initial values of the sliders
+    num_points: number of points on the frontier
+
+    Returns:
+    A function modify_doc(doc) for bokeh.server or show() in a notebook
+    """
+
+    returns = DF.values.astype(float)
+    (T, n) = returns.shape
+    tickers = [str(ticker) for ticker in DF.columns]
+
+    mean_return = returns.mean(axis = 0)
+    coef = 12**0.5
+
+    x = cp.Variable(n)
+    req_param = cp.Parameter(value = req_return)
+    cap_param = cp.Parameter(nonneg = True, value = max_indi_allocation)
+
+    factor = (returns - mean_return) / np.sqrt(T - 1)
+    risk = cp.sum_squares(factor @ x)
+
+    constraints = [cp.sum(x) == 1, mean_return @ x >= req_param, x >= 0, x <= cap_param]
+    prob = cp.Problem(cp.Minimize(risk), constraints)
+
+    def solve(value, cap):
+        """ solve for a required return and maximum allocation, returns the weights or None if infeasible """
+        req_param.value = value
+        cap_param.value = cap
+
+        # the warm started default solver is fast but can stall close to the maximum return, then try the interior point solver
+        for options in ({"warm_start": True}, {"solver": cp.CLARABEL}):
+            try:
+                prob.solve(**options)
+            except:
+                continue
+            if (prob.status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)):
+                return (x.value.copy())
+
+        return (None)
+
+    def frontier_returns(cap):
+        """ required returns of the frontier points for a maximum allocation """
+        weight_min = solve(mean_return.min() - 1.0, cap)
+        if (weight_min is None):
+            return (np.zeros((0)))
+        min_return = mean_return.dot(weight_min)
+
+        # the maximum return is on the edge of the feasible set, pull it back until it solves (see compute_frontier_adaptive)
+        max_return = compute_max_return(mean_return, cap)
+        for attempt in range(5):
+            upper_return = max_return - 1e-4 * 10**attempt * (max_return - min_return)
+            if (upper_return <= min_return or solve(upper_return, cap) is not None):
+                break
+
+        return (np.linspace(min_return, max(upper_return, min_return), num_points))
+
+    def modify_doc(doc):
+
+        state = {"rf": risk_free_rate, "cap": max_indi_allocation, "generation": 0}
+
+        # frontier
+        ret_vector = frontier_returns(max_indi_allocation)
+        std_vector = np.full(len(ret_vector), np.nan)
+        for (k, value) in enumerate(ret_vector):
+            weight = solve(value, max_indi_allocation)
+            if (weight is not None):
+                std_vector[k] = np.linalg.norm(factor.dot(weight))
+
+        frontier_source = ColumnDataSource({"std": std_vector, "ret": ret_vector, "sharpe": coef * (ret_vector - risk_free_rate/12.0) / std_vector})
+
+        # selected portfolio
+        weight = solve(req_return, max_indi_allocation)
+        if (weight is None):
+            weight = np.zeros(n)
+        state["weight"] = weight
+
+        portfolio_source = ColumnDataSource({"std": [np.linalg.norm(factor.dot(weight))], "ret": [mean_return.dot(weight)]})
+        weight_source = ColumnDataSource({"ticker": tickers, "percentage": 100.0 * weight})
+
+        p = figure(x_axis_label = "Standard Deviation", y_axis_label = "monthly return", plot_width=600, plot_height=400, title="Efficient Fronter")
+        p.line("std", "ret", source = frontier_source, line_width=2, legend = "Optimized Portfolio")
+        p.circle("std", "ret", source = frontier_source, size = 4)
+        p.diamond(returns.std(axis = 0, ddof = 1), mean_return, color = "red", size = 4, legend = "Individual Stocks")
+        p.circle("std", "ret", source = portfolio_source, size = 10, color = "green", legend = "Selected Portfolio")
+        p.legend.location = "bottom_right"
+
+        p_weight = figure(x_range = tickers, y_axis_label = "Percentage", plot_width=600, plot_height=250, title="Portfolio")
+        p_weight.vbar(x = "ticker", top = "percentage", source = weight_source, width = 0.8)
+        p_weight.xaxis.major_label_orientation = 1.2
+
+        info = Div(text = "")
+
+        def show_portfolio(elapsed):
+            std = portfolio_source.data["std"][0]
+            ret = portfolio_source.data["ret"][0]
+            sharpe = coef * (ret - state["rf"]/12.0) / std
+            info.text = "Exp return = {:.4f}%, risk = {:.4f}, sharpe ratio = {:.4f} (solved in {:.0f} ms)".format(ret*100, std, sharpe, elapsed*1000)
+
+        def update_portfolio():
+            start = time.time()
+            weight = solve(req_slider.value, state["cap"])
+            if (weight is None):
+                info.text = "No portfolio reaches the required return with this maximum allocation"
+                return
+
+            # only send the weights that changed
+            changed = np.flatnonzero(np.abs(weight - state["weight"]) > 1e-6)
+            if (len(changed) > 0):
+                weight_source.patch({"percentage": [(int(j), 100.0 * weight[j]) for j in changed]})
+            state["weight"] = weight
+
+            portfolio_source.patch({"std": [(0, np.linalg.norm(factor.dot(weight)))], "ret": [(0, mean_return.dot(weight))]})
+            show_portfolio(time.time() - start)
+
+        def update_frontier_point(generation, ret_vector, k):
+            # a newer maximum allocation cancels this update
+            if (generation != state["generation"] or k >= len(ret_vector)):
+                return
+
+            weight = solve(ret_vector[k], state["cap"])
+            std = np.linalg.norm(factor.dot(weight)) if weight is not None else np.nan
+            frontier_source.patch({"std": [(k, std)], "ret": [(k, ret_vector[k])], "sharpe": [(k, coef * (ret_vector[k] - state["rf"]/12.0) / std)]})
+
+            doc.add_next_tick_callback(lambda: update_frontier_point(generation, ret_vector, k + 1))
+
+        def update_frontier(generation):
+            # a newer maximum allocation cancels this update
+            if (generation != state["generation"]):
+                return
+
+            ret_vector = frontier_returns(state["cap"])
+            doc.add_next_tick_callback(lambda: update_frontier_point(generation, ret_vector, 0))
+
+        def on_req_return(attr, old, new):
+            update_portfolio()
+
+        def on_cap(attr, old, new):
+            state["cap"] = new
+            state["generation"] = state["generation"] + 1
+            update_portfolio()
+
+            # re-solve the frontier in the background: its two ends, then one point per tick
+            generation = state["generation"]
+            doc.add_next_tick_callback(lambda: update_frontier(generation))
+
+        def on_risk_free_rate(attr, old, new):
+            start = time.time()
+            state["rf"] = new
+            data = frontier_source.data
+            sharpe = coef * (np.asarray(data["ret"]) - new/12.0) / np.asarray(data["std"])
+            frontier_source.patch({"sharpe": [(slice(0, len(sharpe)), sharpe)]})
+            show_portfolio(time.time() - start)
+
+        req_slider = Slider(start = max(mean_return.min(), 0.0), end = mean_return.max(), value = req_return, step = 0.0005, title = "Required monthly return")
+        cap_slider = Slider(start = 0.01, end = 1.0, value = max_indi_allocation, step = 0.01, title = "Maximum allocation per stock")
+        rf_slider = Slider(start = 0.0, end = 0.1, value = risk_free_rate, step = 0.0025, title = "Annual risk free rate")
+
+        req_slider.on_change("value_throttled", on_req_return)
+        cap_slider.on_change("value_throttled", on_cap)
+        rf_slider.on_change("value_throttled", on_risk_free_rate)
+
+        show_portfolio(0.0)
+
+        doc.add_root(row(column(req_slider, cap_slider, rf_slider, info), column(p, p_weight)))
+
+    return (modify_doc)
+
+
+# explore the S&P 500 frontier (in the notebook, or with bokeh serve)
+show(make_frontier_explorer_app(DF4, risk_free_rate = 0.02))
+
+
+#%% [markdown]
+
+## 5. Export results
+
+# The frontiers of this notebook are written as Parquet datasets partitioned by run date and universe (see run_export.py), so they can be loaded without rerunning the notebook.
+
+#%%
+exporter = RunExporter("results")
+
+exporter.add_frontier("DJIA", "mean-variance", list(DF1.columns), weight, ret, std, sharpe, parameters = {"max_indi_allocation": 0.3, "num_points": 50, "risk_free_rate": 0})
+exporter.add_frontier("DJIA", "risk-parity", list(DF1.columns), weight_rp, [compute_mean_return(DF1).values.dot(weight_rp)], [component_risk_rp[0].sum()], [compute_sharpe_ratio_portfolio(DF1, weight_rp)], parameters = {"risk_budget": "equal"})
+exporter.add_frontier("DJIA", "cvar", list(DF.columns), weight_cvar, ret_cvar, cvar_cvar, sharpe_cvar, parameters = {"beta": 0.95, "num_scenarios": 1000, "period": "D"})
+exporter.add_frontier("SPY", "mean-variance", list(DF4.columns), weight1, ret1, std1, sharpe1, parameters = {"max_indi_allocation": 0.3, "adaptive": True, "risk_free_rate": 0.02})
+exporter.add_frontier("SPY", "hrp", list(DF4.columns), weight_hrp, ret_hrp, std_hrp, sharpe_hrp, parameters = {"linkage_method": "single", "risk_free_rate": 0.02})
+exporter.add_frontier("SPY", "out-of-core", list(symbol_list_large), weight_large, ret_large, std_large, sharpe_large, parameters = {"frequency": "D", "period": "5y", "num_points": 20, "risk_free_rate": 0.02})
+exporter.add_frontier("SPY", "resampled", list(DF4.columns), weight_rs, ret_rs, std_rs, sharpe_rs, parameters = {"num_samples": 200, "method": "bootstrap", "risk_free_rate": 0.02})
+exporter.add_frontier("SPY", "sector-constrained", list(DF4.columns), weight_sector, ret_sector, std_sector, sharpe_sector, parameters = {"max_active_weight": 0.05, "risk_free_rate": 0.02})
+
+exporter.close()
+
 #%%
@@ -0,0 +1,103 @@
+""" Worker of the resampled efficient frontier
+
+The process pool of compute_resampled_frontier (Simple Portfolio Optimizer) has to import the
+function it runs, which is not possible for a function defined in a notebook when the processes
+are spawned (Windows, macOS). The worker and the helpers it needs are therefore kept in this module:
+
+    from resampled_frontier import compute_max_return, solve_resampled_frontier_batch
+"""
+
+import cvxpy as cp
+import numpy as np
+
+
+def compute_max_return(mean_return, max_indi_allocation = 0.3):
+    """ maximum expected return of a long only portfolio when each stock is capped at max_indi_allocation
+
+    The best portfolio simply fills the stocks with the highest return up to the cap, so no solver is needed.
+    Returns NaN if the cap is too small for the weights to add up to 1
+    """
+
+    mean_return = np.asarray(mean_return, dtype = float)
+
+    if (max_indi_allocation * len(mean_return) < 1.0):
+        return (np.nan)
+
+    ranked = np.sort(mean_return)[::-1]
+    allocation = np.clip(1.0 - max_indi_allocation * np.arange(len(ranked)), 0.0, max_indi_allocation)
+
+    return (ranked.dot(allocation))
+
+
+def solve_resampled_frontier_batch(args):
+
+    """Solve the frontier of a batch of resampled return panels (worker of compute_resampled_frontier)
+
+    One parametric problem is compiled for the whole batch: the mean return, the risk factor
+    (centered returns / sqrt(T-1), so that variance = ||factor * x||^2) and the required return are
+    cvxpy Parameters, and every solve is warm started from the previous one.
+
+    Parameters:
+    args: A tuple (returns, index, mean, chol, seed, num_samples, num_points, max_indi_allocation).
+    For bootstrap resampling index holds the resampled row numbers (num_samples x T) and mean/chol are None.
+    For parametric resampling index is None and the returns are drawn from a normal distribution with the given mean and cholesky factor
+
+    Returns:
+    A numpy array of weights (num_samples x num_points x number of stocks), NaN where a solve failed
+    """
+
+    (returns, index, mean, chol, seed, num_samples, num_points, max_indi_allocation) = args
+
+    (T, n) = returns.shape
+
+    # all resamples of the batch at once
+    if (index is not None):
+        samples = returns[index]
+    else:
+        rng = np.random.default_rng(seed)
+        samples = mean + rng.standard_normal((num_samples, T, n)).dot(chol.T)
+
+    sample_mean = samples.mean(axis = 1)
+    sample_factor = (samples - sample_mean[:, None, :]) / np.sqrt(T - 1)
+
+    x = cp.Variable(n)
+    mean_return = cp.Parameter(n)
+    factor = cp.Parameter((T, n))
+    req_return = cp.Parameter()
+
+    constraints = [cp.sum(x) == 1, mean_return @ x >= req_return, x >= 0, x <= max_indi_allocation]
+
+    prob = cp.Problem(cp.Minimize(cp.sum_squares(factor @ x)), constraints)
+
+    def solve(value):
+        """ solve for a required return, returns False if the solve failed """
+        req_return.value = value
+        try:
+            prob.solve(warm_start = True)
+        except:
+            return (False)
+        return (prob.status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE))
+
+    weight = np.full((num_samples, num_points, n), np.nan)
+
+    for k in range(num_samples):
+
+        mean_return.value = sample_mean[k]
+        factor.value = sample_factor[k]
+
+        # minimum variance portfolio, if there is no solution leave the sample as NaN
+        if (not solve(sample_mean[k].min() - 1.0)):
+            continue
+
+        min_return = sample_mean[k].dot(x.value)
+
+        # points evenly spaced up to the maximum return, pulled back slightly from the edge of the feasible set
+        max_return = compute_max_return(sample_mean[k], max_indi_allocation)
+        max_return = max_return - 1e-4 * (max_return - min_return)
+
+        # a point without a solution is left as NaN
+        for (point, value) in enumerate(np.linspace(min_return, max_return, num_points)):
+            if (solve(value)):
+                weight[k, point] = x.value
+
+    return (weight)
@@ -0,0 +1,128 @@
+""" Export of the optimizer and comparison results as Parquet datasets
+
+Every output of a run is collected by a RunExporter and written when the run is closed, as
+Parquet datasets partitioned by run date and universe (hive style, e.g.
+results/frontier_weights/run_date=2019-12-31/universe=SPY/<run id>-0.parquet), so a
+warehouse can bulk load a night of results without any Python post-processing:
+
+    exporter = RunExporter("results")
+    exporter.add_frontier("SPY", "mean-variance", symbol_list, weight, ret, std, sharpe, parameters = {"max_indi_allocation": 0.3})
+    exporter.close()
+
+Datasets:
+frontier_weights: run_id, name, point, ticker, weight
+frontier_points: run_id, name, point, return, risk, sharpe
+total_return: run_id, name, purchase_date, ticker, cumulative_return
+run_metadata: run_id, name, kind, rows, created_at, parameters (JSON)
+"""
+
+import json
+import os
+import uuid
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+class RunExporter:
+    """ collect the outputs of one run and write them as partitioned Parquet datasets
+
+    Parameter:
+    root_path: directory of the datasets
+    run_date: date of the run (partition), defaulted to today
+    run_id: identifier of the run, defaulted to a random uuid. It is also the file name, so runs never overwrite each other
+    batch_rows: number of rows per record batch and per Parquet row group
+    """
+
+    def __init__(self, root_path, run_date = None, run_id = None, batch_rows = 100000):
+        self.root_path = root_path
+        self.run_date = str(run_date if run_date is not None else date.today())
+        self.run_id = run_id if run_id is not None else uuid.uuid4().hex
+        self.batch_rows = batch_rows
+
+        # dataset name -> list of record batches
+        self.batches = {}
+
+    def add_batches(self, dataset, universe, columns):
+        """ split a dictionary of equal length numpy arrays into record batches of the dataset """
+
+        rows = len(next(iter(columns.values())))
+
+        columns = dict(columns)
+        columns["run_date"] = np.full(rows, self.run_date)
+        columns["universe"] = np.full(rows, universe)
+
+        table = pa.table(columns)
+        self.batches.setdefault(dataset, []).extend(table.to_batches(max_chunksize = self.batch_rows))
+
+        return (rows)
+
+    def add_metadata(self, universe, name, kind, rows, parameters = None):
+        """ record one output of the run in the run_metadata dataset """
+
+        self.add_batches("run_metadata", universe, {
+            "run_id": np.array([self.run_id]),
+            "name": np.array([name]),
+            "kind": np.array([kind]),
+            "rows": np.array([rows], dtype = np.int64),
+            "created_at": np.array([datetime.now().isoformat()]),
+            "parameters": np.array([json.dumps(parameters if parameters is not None else {}, default = str)])})
+
+    def add_frontier(self, universe, name, symbol_list, weight, ret, risk, sharpe, parameters = None):
+        """ add the weights (one row per point and stock) and the return/risk/sharpe arrays of a frontier
+
+        Parameter:
+        universe: name of the stock universe (partition), e.g. "SPY"
+        name: name of the frontier, e.g. "mean-variance" or "cvar"
+        symbol_list: the stocks in the same order as the columns of weight
+        weight, ret, risk, sharpe: the output of compute_frontier (or any function with the same format)
+        parameters: dictionary of the run parameters, stored as JSON in run_metadata
+        """
+
+        weight = np.atleast_2d(np.asarray(weight, dtype = float))
+        (num_points, n) = weight.shape
+
+        rows = self.add_batches("frontier_weights", universe, {
+            "run_id": np.full(num_points * n, self.run_id),
+            "name": np.full(num_points * n, name),
+            "point": np.repeat(np.arange(num_points, dtype = np.int32), n),
+            "ticker": np.tile(np.asarray(symbol_list, dtype = str), num_points),
+            "weight": weight.ravel()})
+
+        self.add_batches("frontier_points", universe, {
+            "run_id": np.full(num_points, self.run_id),
+            "name": np.full(num_points, name),
+            "point": np.arange(num_points, dtype = np.int32),
+            "return": np.asarray(ret, dtype = float),
+            "risk": np.asarray(risk, dtype = float),
+            "sharpe": np.asarray(sharpe, dtype = float)})
+
+        self.add_metadata(universe, name, "frontier", rows, parameters)
+
+    def add_total_return(self, universe, name, DF, parameters = None):
+        """ add a panel from compute_total_return_by_day (purchase dates x tickers), one row per purchase date and ticker """
+
+        (T, n) = DF.shape
+
+        rows = self.add_batches("total_return", universe, {
+            "run_id": np.full(T * n, self.run_id),
+            "name": np.full(T * n, name),
+            "purchase_date": np.repeat(pd.DatetimeIndex(DF.index).values, n),
+            "ticker": np.tile(np.asarray(DF.columns, dtype = str), T),
+            "cumulative_return": DF.values.astype(float).ravel()})
+
+        self.add_metadata(universe, name, "total_return", rows, parameters)
+
+    def close(self):
+        """ write every dataset, one Parquet file per partition and dataset """
+
+        for (dataset, batches) in self.batches.items():
+            ds.write_dataset(pa.Table.from_batches(batches), os.path.join(self.root_path, dataset), format = "parquet",
+                             partitioning = ["run_date", "universe"], partitioning_flavor = "hive",
+                             basename_template = self.run_id + "-{i}.parquet", existing_data_behavior = "overwrite_or_ignore",
+                             max_rows_per_group = self.batch_rows, min_rows_per_group = min(self.batch_rows, 1024))
+
+        self.batches = {}
@@ -0,0 +1,248 @@
+""" Synthetic market data in the same format as yfinance
+
+The notebooks load every price with yf.download, so nothing runs without the network.
+This module generates deterministic prices from a factor model and can be used in place
+of the yfinance module:
+
+    data_source = SyntheticYahooFinance(seed = 0)
+    DF = data_source.download(["SPY", "AAPL"], period = "5y")
+
+The same ticker and seed always give the same price history, no matter which other tickers
+are requested or which period is selected.
+
+SyntheticQuandl does the same for the treasury yield curve loaded with quandl.get:
+
+    rate_source = SyntheticQuandl(seed = 0)
+    treasury = rate_source.get("USTREASURY/YIELD")
+"""
+
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+# number of trading days per year
+TRADING_DAYS = 252
+
+# valid periods: 1d,5d,1mo,3mo,6mo,1y,2y,5y,10y,ytd,max
+PERIOD_YEARS = {"1d": 1.0/TRADING_DAYS, "5d": 5.0/TRADING_DAYS, "1mo": 1.0/12, "3mo": 0.25, "6mo": 0.5,
+                "1y": 1.0, "2y": 2.0, "5y": 5.0, "10y": 10.0}
+
+PRICE_FIELDS = ["Adj Close", "Close", "High", "Low", "Open", "Volume"]
+ACTION_FIELDS = ["Dividends", "Stock Splits"]
+
+# maturities of the USTREASURY/YIELD dataset, in years
+TREASURY_MATURITIES = {"1 MO": 1.0/12, "2 MO": 2.0/12, "3 MO": 0.25, "6 MO": 0.5, "1 YR": 1.0, "2 YR": 2.0, "3 YR": 3.0,
+                       "5 YR": 5.0, "7 YR": 7.0, "10 YR": 10.0, "20 YR": 20.0, "30 YR": 30.0}
+
+
+def parse_symbol_list(symbol_list):
+    """ given a ticker, a space/comma separated string of tickers or a list, return a sorted list of unique tickers (same as yfinance) """
+
+    if (isinstance(symbol_list, str)):
+        symbol_list = symbol_list.replace(",", " ").split()
+
+    return (sorted(set(symbol.upper() for symbol in symbol_list)))
+
+
+def draw_parameter(rng, value):
+    """ a parameter is either a float for all tickers or a (low, high) tuple to draw each ticker uniformly """
+
+    if (isinstance(value, (tuple, list))):
+        return (rng.uniform(value[0], value[1]))
+    return (value)
+
+
+def generate_market_data(symbol_list, period = "5y", actions = False, seed = 0, end = "2019-12-31", max_years = 30,
+                         drift = (0.02, 0.12), volatility = (0.15, 0.45), correlation = 0.3, num_factors = 5,
+                         dividend_yield = (0.0, 0.04), listing_probability = 0.1, missing_rate = 0.001, dtype = np.float64):
+    """
+    generate a synthetic yahoo finance dataframe from a factor model
+
+    The daily log return of each ticker is drift plus volatility times a mix of common factors (the first one is the market)
+    and an idiosyncratic shock. Dividends are paid quarterly and the "Adj Close" is adjusted for them the same way as Yahoo.
+
+    Parameter:
+    symbol_list: A list of tickers (or a space separated string)
+    period: same as yfinance (1d,5d,1mo,3mo,6mo,1y,2y,5y,10y,ytd,max). "max" covers max_years
+    actions: if True, add the "Dividends" and "Stock Splits" columns
+    seed: random seed, the output is deterministic for a given seed
+    end: the last trading day
+    max_years: length of the full history
+    drift, volatility, dividend_yield: annual rates, either a float or a (low, high) range to draw each ticker
+    correlation: share of the variance explained by the common factors
+    num_factors: number of common factors
+    listing_probability: probability that a ticker is listed after the start of the full history (missing values before listing)
+    missing_rate: probability of a missing value on any day
+    dtype: np.float64, or np.float32 to halve the memory for large universes
+
+    Return:
+    A panda dataframe shaped like yf.download: the columns are a MultiIndex (field, ticker), or just the fields if a single ticker is requested
+    """
+
+    symbols = parse_symbol_list(symbol_list)
+    n = len(symbols)
+
+    # the full history, so that a ticker has the same prices for every period
+    all_dates = pd.bdate_range(end = end, periods = int(round(max_years * TRADING_DAYS)), name = "Date")
+    T_max = len(all_dates)
+
+    if (period == "max"):
+        first = 0
+    elif (period == "ytd"):
+        first = int(np.searchsorted(all_dates, pd.Timestamp(all_dates[-1].year, 1, 1)))
+    else:
+        first = max(T_max - max(int(round(PERIOD_YEARS[period] * TRADING_DAYS)), 1), 0)
+
+    dates = all_dates[first:]
+    T = len(dates)
+
+    fields = PRICE_FIELDS + ACTION_FIELDS if actions else PRICE_FIELDS
+    column = dict((field, k) for (k, field) in enumerate(fields))
+
+    # one contiguous block for all fields and tickers
+    data = np.empty((T, len(fields) * n), dtype = dtype)
+
+    factors = np.random.default_rng([seed, 0]).standard_normal((T_max, num_factors))
+
+    daily_volatility = 1.0 / np.sqrt(TRADING_DAYS)
+
+    for (i, symbol) in enumerate(symbols):
+
+        # each ticker has its own random stream, independent of the other tickers requested
+        rng = np.random.default_rng([seed, zlib.crc32(symbol.encode())])
+
+        mu = draw_parameter(rng, drift)
+        sigma = draw_parameter(rng, volatility)
+        quarterly_dividend = draw_parameter(rng, dividend_yield) / 4.0
+
+        loading = np.append(1.0, rng.normal(0.0, 0.5, num_factors - 1))
+        loading = loading / np.linalg.norm(loading)
+
+        shock = np.sqrt(correlation) * factors.dot(loading) + np.sqrt(1.0 - correlation) * rng.standard_normal(T_max)
+        log_return = (mu - 0.5 * sigma**2) / TRADING_DAYS + sigma * daily_volatility * shock
+        log_return[0] = 0.0
+
+        # dividend every quarter, the price drops by the dividend on the ex-dividend date
+        dividend_day = (np.arange(T_max) % 63) == rng.integers(63)
+        dividend_day[0] = False
+        growth = np.exp(log_return)
+        close = rng.uniform(10.0, 200.0) * np.cumprod(growth - quarterly_dividend * dividend_day)
+        dividend = np.zeros(T_max)
+        dividend[1:] = quarterly_dividend * close[:-1] * dividend_day[1:]
+
+        # intraday prices and volume
+        open_price = np.empty(T_max)
+        open_price[0] = close[0]
+        open_price[1:] = close[:-1] * np.exp(0.2 * sigma * daily_volatility * rng.standard_normal(T_max - 1))
+        high = np.maximum(open_price, close) * np.exp(0.5 * sigma * daily_volatility * np.abs(rng.standard_normal(T_max)))
+        low = np.minimum(open_price, close) * np.exp(-0.5 * sigma * daily_volatility * np.abs(rng.standard_normal(T_max)))
+        volume = np.round(rng.lognormal(13.0, 0.5, T_max))
+
+        missing = rng.random(T_max) < missing_rate
+        if (rng.random() < listing_probability):
+            missing[:rng.integers(1, T_max)] = True
+
+        close, dividend, open_price, high, low, volume, missing = (a[first:] for a in (close, dividend, open_price, high, low, volume, missing))
+
+        # same as Yahoo: adjusted close equals close today, earlier prices are scaled down by every later dividend
+        total_return = np.cumprod(np.append(1.0, (close[1:] + dividend[1:]) / close[:-1]))
+        adjusted_close = close[-1] * total_return / total_return[-1]
+
+        values = {"Adj Close": adjusted_close, "Close": close, "High": high, "Low": low, "Open": open_price,
+                  "Volume": volume, "Dividends": dividend, "Stock Splits": np.zeros(T)}
+
+        for field in fields:
+            series = values[field]
+            series[missing] = np.nan
+            data[:, column[field] * n + i] = series
+
+    # yfinance returns plain field columns for a single ticker
+    if (n == 1):
+        return (pd.DataFrame(data, index = dates, columns = fields))
+
+    columns = pd.MultiIndex.from_product([fields, symbols])
+
+    return (pd.DataFrame(data, index = dates, columns = columns))
+
+
+class SyntheticYahooFinance:
+    """ offline stand-in for the yfinance module, pass it as the data source of load_symbol
+
+    Parameter:
+    seed: random seed
+    options: any keyword argument of generate_market_data (e.g. end, correlation, dtype)
+    """
+
+    def __init__(self, seed = 0, **options):
+        self.seed = seed
+        self.options = options
+
+    def download(self, tickers, period = "5y", actions = False, **kwargs):
+        """ same signature as yf.download, other yfinance arguments (progress, group_by, ...) are ignored """
+
+        return (generate_market_data(tickers, period = period, actions = actions, seed = self.seed, **self.options))
+
+
+def generate_treasury_yield(seed = 0, end = "2019-12-31", max_years = 30, long_rate = 4.0, slope = 1.5, volatility = 0.8, mean_reversion = 0.2):
+    """
+    generate a synthetic treasury yield curve in the same format as quandl.get("USTREASURY/YIELD")
+
+    The short rate follows a mean reverting random walk around long_rate - slope, and each maturity adds a term premium
+    that grows with the maturity up to slope at 30 years. The dates are the same as generate_market_data with the same end and max_years.
+
+    Parameter:
+    seed: random seed, the output is deterministic for a given seed
+    end: the last trading day
+    max_years: length of the history
+    long_rate: average 30 year yield in percent
+    slope: average spread between the 30 year and the short rate in percent
+    volatility: annual volatility of the short rate in percent
+    mean_reversion: annual speed of mean reversion of the short rate
+
+    Return:
+    A panda dataframe of yields in percent, one column per maturity ("1 MO", ..., "10 YR", "30 YR")
+    """
+
+    dates = pd.bdate_range(end = end, periods = int(round(max_years * TRADING_DAYS)), name = "Date")
+    T = len(dates)
+
+    rng = np.random.default_rng([seed, zlib.crc32(b"USTREASURY/YIELD")])
+
+    # the short rate, mean reverting and kept above zero
+    short_rate = np.empty(T)
+    short_rate[0] = long_rate - slope
+    shock = volatility / np.sqrt(TRADING_DAYS) * rng.standard_normal(T)
+    for t in range(1, T):
+        short_rate[t] = max(short_rate[t - 1] + mean_reversion / TRADING_DAYS * (long_rate - slope - short_rate[t - 1]) + shock[t], 0.01)
+
+    # the term premium flattens as the maturity grows, plus a small noise per maturity
+    maturity = np.array(list(TREASURY_MATURITIES.values()))
+    premium = slope * (1.0 - np.exp(-maturity / 5.0)) / (1.0 - np.exp(-30.0 / 5.0))
+    curve = short_rate[:, None] + premium[None, :] + 0.02 * rng.standard_normal((T, len(maturity)))
+
+    return (pd.DataFrame(np.maximum(curve, 0.0).round(2), index = dates, columns = list(TREASURY_MATURITIES)))
+
+
+class SyntheticQuandl:
+    """ offline stand-in for the quandl module, only the USTREASURY/YIELD dataset is available
+
+    Parameter:
+    seed: random seed
+    options: any keyword argument of generate_treasury_yield (e.g. end, long_rate)
+    """
+
+    def __init__(self, seed = 0, **options):
+        self.seed = seed
+        self.options = options
+
+    def get(self, dataset, start_date = None, end_date = None, **kwargs):
+        """ same signature as quandl.get, other quandl arguments (authtoken, ...) are ignored """
+
+        if (dataset != "USTREASURY/YIELD"):
+            raise ValueError("synthetic data is only available for USTREASURY/YIELD, not " + str(dataset))
+
+        DF = generate_treasury_yield(seed = self.seed, **self.options)
+
+        return (DF.loc[start_date:end_date])